@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+    Annotator benchmarks
+    ~~~~~~~~~~~~~~~~~~~~
+    Per-annotation overhead of PdfAnnotator.add_annotation vs.
+    PdfAnnotator.add_annotations. Run from the repository root:
+
+        python benchmarks/bench_annotator.py
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pdf_annotate import Appearance  # noqa: E402
+from pdf_annotate import Location  # noqa: E402
+from pdf_annotate import PdfAnnotator  # noqa: E402
+
+
+SIMPLE = os.path.join(
+    os.path.dirname(__file__), '..', 'tests', 'pdfs', 'simple.pdf',
+)
+N = 2000
+
+
+def make_items(n):
+    appearance = Appearance(stroke_color=(1, 0, 0), stroke_width=2)
+    return [
+        (
+            'square',
+            Location(x1=i % 500, y1=i % 700, x2=i % 500 + 10, y2=i % 700 + 10, page=0),
+            appearance,
+        )
+        for i in range(n)
+    ]
+
+
+def bench_add_annotation(items):
+    a = PdfAnnotator(SIMPLE)
+    for item in items:
+        a.add_annotation(*item)
+
+
+def bench_add_annotations(items):
+    a = PdfAnnotator(SIMPLE)
+    a.add_annotations(items)
+
+
+def report(name, func, *args):
+    best = min(timeit.repeat(lambda: func(*args), number=1, repeat=5))
+    print('{:<32} {:>10.1f} us/op'.format(name, best / N * 1e6))
+
+
+if __name__ == '__main__':
+    items = make_items(N)
+    report('add_annotation (loop)', bench_add_annotation, items)
+    report('add_annotations (batch)', bench_add_annotations, items)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+    Graphics benchmarks
+    ~~~~~~~~~~~~~~~~~~~
+    Transforming and resolving ink-like content streams. Run from the
+    repository root:
+
+        python benchmarks/bench_graphics.py
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+import os.path
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pdf_annotate.graphics import CompactContentStream  # noqa: E402
+from pdf_annotate.graphics import ContentStream  # noqa: E402
+from pdf_annotate.graphics import format_number  # noqa: E402
+from pdf_annotate.graphics import format_numbers  # noqa: E402
+from pdf_annotate.graphics import Line  # noqa: E402
+from pdf_annotate.graphics import Move  # noqa: E402
+from pdf_annotate.graphics import Restore  # noqa: E402
+from pdf_annotate.graphics import Save  # noqa: E402
+from pdf_annotate.graphics import Stroke  # noqa: E402
+from pdf_annotate.util import geometry  # noqa: E402
+
+
+NUM_POINTS = 10000
+TRANSFORM = [0, 0.48, -0.48, 0, 612, 0]
+
+
+def make_ink_points(n, seed=0):
+    """Random walk, roughly like a pen stroke digitized at screen resolution."""
+    rng = random.Random(seed)
+    x, y = 300.0, 400.0
+    points = []
+    for _ in range(n):
+        x += rng.uniform(-2, 2)
+        y += rng.uniform(-2, 2)
+        points.append((x, y))
+    return points
+
+
+def make_commands(points):
+    return (
+        [Save(), Move(*points[0])] +
+        [Line(x, y) for x, y in points[1:]] +
+        [Stroke(), Restore()]
+    )
+
+
+def format_number_baseline(n):
+    """The original, one-at-a-time format_number, for comparison."""
+    if abs(n) < 0.00000000000001:
+        return '0'
+    if n % 1 == 0:
+        return str(int(n))
+    string = '{:.10f}'.format(n)
+    while string.endswith('0'):
+        string = string[:-1]
+    return string
+
+
+def report(name, func, number=5):
+    best = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print('{:<40} {:>10.2f} ms'.format(name, best * 1e3))
+
+
+if __name__ == '__main__':
+    commands = make_commands(make_ink_points(NUM_POINTS))
+    stream = ContentStream(commands)
+    compact = CompactContentStream(commands)
+    print('{} points'.format(NUM_POINTS))
+
+    report('ContentStream.transform', lambda: stream.transform(TRANSFORM))
+    report('CompactContentStream.transform', lambda: compact.transform(TRANSFORM))
+    numpy = geometry.numpy
+    geometry.numpy = None
+    report('CompactContentStream.transform (no numpy)', lambda: compact.transform(TRANSFORM))
+    geometry.numpy = numpy
+
+    report('ContentStream.resolve', stream.resolve)
+    report('CompactContentStream.resolve', compact.resolve)
+
+    numbers = [c for point in make_ink_points(NUM_POINTS) for c in point]
+    print('{} numbers'.format(len(numbers)))
+    report('format_number (baseline)', lambda: [format_number_baseline(n) for n in numbers])
+    report('format_number', lambda: [format_number(n) for n in numbers])
+    report('format_numbers', lambda: format_numbers(numbers))
+    report('format_numbers (precision=4)', lambda: format_numbers(numbers, 4))
+    report('format_numbers (precision=None)', lambda: format_numbers(numbers, None))
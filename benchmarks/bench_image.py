@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+    Image benchmarks
+    ~~~~~~~~~~~~~~~~
+    Extracting raw samples from images of increasing size, as
+    get_raw_image_bytes used to (one pixel tuple at a time) vs. now. Run from
+    the repository root:
+
+        python benchmarks/bench_image.py
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+import os.path
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image as PILImage  # noqa: E402
+
+from pdf_annotate.annotations.image import Image  # noqa: E402
+
+
+SIZES = [(640, 480), (1600, 1200), (4000, 3000)]
+MODES = ['L', 'RGB']
+
+
+def make_image(mode, size, seed=0):
+    """Noise, so that nothing about the image is unrealistically uniform."""
+    rng = random.Random(seed)
+    width, height = size
+    bands = len(mode)
+    data = bytes(rng.getrandbits(8) for _ in range(width * bands))
+    return PILImage.frombytes(mode, size, data * height)
+
+
+def get_raw_image_bytes_baseline(image):
+    """The original, pixel-at-a-time get_raw_image_bytes, for comparison."""
+    if image.mode == 'L':
+        return bytes(bytearray(image.getdata()))
+    array = bytearray()
+    for rgb in list(image.getdata()):
+        array.extend(rgb)
+    return bytes(array)
+
+
+def report(name, func, number=1):
+    best = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print('{:<40} {:>10.2f} ms'.format(name, best * 1e3))
+
+
+if __name__ == '__main__':
+    for size in SIZES:
+        for mode in MODES:
+            image = make_image(mode, size)
+            assert Image.get_raw_image_bytes(image) == get_raw_image_bytes_baseline(image)
+            print('{}x{} {}'.format(size[0], size[1], mode))
+            report('get_raw_image_bytes (baseline)', lambda: get_raw_image_bytes_baseline(image))
+            report('get_raw_image_bytes', lambda: Image.get_raw_image_bytes(image))
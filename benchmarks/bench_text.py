@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+    Text wrapping benchmarks
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+    Wrapping multi-kilobyte FreeText notes with unshift_line, as
+    get_wrapped_lines used to, vs. get_line_breaks. Run from the repository
+    root:
+
+        python benchmarks/bench_text.py
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+import os.path
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pdf_annotate.annotations.text import HELVETICA_PATH  # noqa: E402
+from pdf_annotate.config.constants import DEFAULT_BASE_FONT  # noqa: E402
+from pdf_annotate.util.text import get_line_breaks  # noqa: E402
+from pdf_annotate.util.text import get_wrapped_lines  # noqa: E402
+from pdf_annotate.util.text import unshift_line  # noqa: E402
+from pdf_annotate.util.true_type_font import get_true_type_font  # noqa: E402
+
+
+SIZES = [1000, 4000, 16000]
+FONT_SIZE = 12
+MAX_LENGTH = 300
+
+
+def make_note(size, seed=0):
+    """Paragraphs of random words, about size characters long."""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(1, 10)))
+        sep = '\n' if rng.random() < 0.02 else ' '
+        words.append(word + sep)
+        length += len(word) + 1
+    return ''.join(words)
+
+
+def unshift_lines(text, measure, max_length):
+    line = unshift_line(text, measure, max_length)
+    lines = [line['text']]
+    while len(line['remainder']) > 0:
+        line = unshift_line(line['remainder'], measure, max_length)
+        lines.append(line['text'])
+    return lines
+
+
+def line_breaks(text, font):
+    breaks = get_line_breaks(
+        text,
+        font.get_advance_widths(text),
+        MAX_LENGTH,
+        scale=font.scale_width,
+    )
+    return [text[start:end] for start, end in breaks]
+
+
+def report(name, func, number=3):
+    best = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print('{:<40} {:>10.2f} ms'.format(name, best * 1e3))
+
+
+if __name__ == '__main__':
+    font = get_true_type_font(HELVETICA_PATH, DEFAULT_BASE_FONT, FONT_SIZE)
+    for size in SIZES:
+        text = make_note(size)
+        assert line_breaks(text, font) == unshift_lines(text, font.measure_text, MAX_LENGTH)
+        print('{} characters'.format(len(text)))
+        report('unshift_line', lambda: unshift_lines(text, font.measure_text, MAX_LENGTH))
+        report('get_wrapped_lines', lambda: get_wrapped_lines(text, font.measure_text, MAX_LENGTH))
+        report('get_line_breaks', lambda: line_breaks(text, font))
@@ -14,6 +14,7 @@ from pdf_annotate.config.constants import GRAPHICS_STATE_NAME
 from pdf_annotate.config.metadata import serialize_value
 from pdf_annotate.util.geometry import transform_rect
 from pdf_annotate.util.geometry import translate
+from pdf_annotate.util.resources import DocumentResources
 
 
 ALL_VERSIONS = ('1.3', '1.4', '1.5', '1.6', '1.7')
@@ -40,6 +41,9 @@ class Annotation(object):
     editing.
     """
     versions = ALL_VERSIONS
+    # Registry of resource objects shared across the document, e.g. fonts.
+    # Set by as_pdf_object for add_additional_resources to use.
+    _document_resources = None
 
     def __init__(self, location, appearance, metadata=None):
         """
@@ -51,15 +55,21 @@ class Annotation(object):
         self._appearance = appearance
         self._metadata = metadata
 
-    def as_pdf_object(self, transform, page):
+    def as_pdf_object(self, transform, page, document_resources=None):
         """Return the PdfDict object representing the annotation, that will be
         inserted as is into the PDF document.
 
         :param list transform: Transformation matrix to transform the coords
             of the annotation from client-specified space to PDF user space.
         :param PdfDict page: The pdfrw page object from the PDF document
+        :param DocumentResources|None document_resources: resource objects
+            shared with the document's other annotations. If None, the
+            annotation gets resource objects of its own.
         :returns PdfDict: the annotation object to be inserted into the PDF
         """
+        if document_resources is None:
+            document_resources = DocumentResources()
+        self._document_resources = document_resources
         bounding_box = transform_rect(self.make_rect(), transform)
         appearance_stream = self._make_appearance_stream_dict(
             bounding_box,
@@ -193,7 +203,8 @@ class Annotation(object):
 
     def add_additional_resources(self, resources):
         """Add additional keys to the Resources PDF dictionary. Default is a
-        no-op.
+        no-op. Resource objects that can be shared with the document's other
+        annotations, e.g. fonts, can be got from self._document_resources.
 
         :param PdfDict resources: Resources PDF dictionary
         """
@@ -7,8 +7,14 @@
     :copyright: Copyright 2019 Autodesk, Inc.
     :license: MIT, see LICENSE for details.
 """
+import hashlib
+import math
+import os
+import struct
 import sys
 import zlib
+from collections import namedtuple
+from functools import partial
 from io import BytesIO
 
 from pdfrw import PdfDict
@@ -19,8 +25,10 @@ from PIL.ImageFile import ImageFile
 from pdf_annotate.annotations.rect import RectAnnotation
 from pdf_annotate.config.appearance import set_appearance_state
 from pdf_annotate.config.constants import CMYK_MODE
+from pdf_annotate.config.constants import DEFAULT_IMAGE_COMPRESS_LEVEL
 from pdf_annotate.config.constants import GRAYSCALE_ALPHA_MODE
 from pdf_annotate.config.constants import GRAYSCALE_MODE
+from pdf_annotate.config.constants import IMAGE_STRIP_SIZE
 from pdf_annotate.config.constants import PALETTE_MODE
 from pdf_annotate.config.constants import RGB_MODE
 from pdf_annotate.config.constants import RGBA_MODE
@@ -35,6 +43,18 @@ from pdf_annotate.util.geometry import matrix_multiply
 from pdf_annotate.util.geometry import scale
 from pdf_annotate.util.geometry import translate
 
+# Image data ready to be made into an Image XObject by Image.make_xobject.
+# Unlike a PdfDict, it can be pickled, e.g. to send it between processes.
+EncodedImage = namedtuple('EncodedImage', [
+    'content',  # Stream data, bytes
+    'filter',  # Name of the stream's filter, e.g. 'FlateDecode'
+    'color_space',  # Name of the color space, e.g. 'DeviceRGB'
+    'width',
+    'height',
+    'decode_parms',  # dict of DecodeParms entries, or None
+    'smask',  # EncodedImage of the alpha channel, or None
+])
+
 
 class Image(RectAnnotation):
     """A basic Image annotation class.
@@ -52,14 +72,60 @@ class Image(RectAnnotation):
 
     Additional work needs to be done. For example:
         - supporting the reading of transparency directly from RGBA images
-        - better compression (e.g. using a Predictor value for FlateDecode)
         - supporting DeviceCMYK directly
     """
 
     subtype = 'Square'
     _image_xobject = None  # PdfDict of Image XObject
+    _max_size = None  # Size (pixels) to downsample the image to fit in
+
+    def as_pdf_object(self, transform, page, document_resources=None):
+        self.fit_to(transform)
+        return super(Image, self).as_pdf_object(
+            transform,
+            page,
+            document_resources,
+        )
+
+    def fit_to(self, transform):
+        """Set the size the image is downsampled to, which depends on the size
+        it's drawn at on the page. See get_max_image_size.
+
+        :param list transform: transformation matrix
+        """
+        self._max_size = self.get_max_image_size(transform)
+
+    def get_max_image_size(self, transform):
+        """Get the largest size, in pixels, at which the image is drawn at no
+        more than the appearance's image_max_dpi, given the transform to PDF
+        user space (in which there are 72 units per inch).
+
+        :param list transform: transformation matrix
+        :returns tuple|None: (width, height), or None if image_max_dpi isn't
+            set
+        """
+        max_dpi = self._appearance.image_max_dpi
+        if max_dpi is None:
+            return None
+        L = self._location
+        a, b, c, d, _, _ = transform
+        # Length, in user space, of the box's sides, which the image's width
+        # and height are stretched to
+        width = abs(L.x2 - L.x1) * math.hypot(a, b)
+        height = abs(L.y2 - L.y1) * math.hypot(c, d)
+        return (
+            max(1, int(math.ceil(width / 72.0 * max_dpi))),
+            max(1, int(math.ceil(height / 72.0 * max_dpi))),
+        )
 
     def add_additional_resources(self, resources):
+        if self._image_xobject is None:
+            # Annotations showing the same image, converted the same way,
+            # share one XObject.
+            self._image_xobject = self._document_resources.get_image(
+                self.get_image_key(),
+                self._make_image_xobject,
+            )
         resources.XObject = PdfDict(Image=self.image_xobject)
 
     def add_additional_pdf_object_data(self, obj):
@@ -68,19 +134,58 @@ class Image(RectAnnotation):
     @property
     def image_xobject(self):
         if self._image_xobject is None:
-            self._image_xobject = self.make_image_xobject(
-                self._appearance.image,
-            )
+            self._image_xobject = self._make_image_xobject()
         return self._image_xobject
 
+    def _make_image_xobject(self):
+        return self.make_image_xobject(**self.get_image_arguments())
+
+    def get_image_arguments(self):
+        """Keyword arguments of make_image_xobject and encode_image for this
+        annotation's image.
+
+        :returns dict:
+        """
+        A = self._appearance
+        return dict(
+            image=A.image,
+            predictor=A.image_predictor,
+            compress_level=A.image_compress_level,
+            jpeg_passthrough=A.image_jpeg_passthrough,
+            max_size=self._max_size,
+        )
+
+    def get_image_key(self):
+        """Key identifying the image XObject by the image's content and the
+        settings it's converted with.
+
+        :returns tuple:
+        """
+        A = self._appearance
+        return (
+            Image.hash_image(A.image),
+            A.image_predictor,
+            A.image_compress_level,
+            A.image_jpeg_passthrough,
+            self._max_size,
+        )
+
     @staticmethod
-    def make_image_xobject(image):
+    def make_image_xobject(
+        image,
+        predictor=True,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+        jpeg_passthrough=True,
+        max_size=None,
+    ):
         """Construct a PdfDict representing the Image XObject, for inserting
         into the AP Resources dict.
 
         PNGs and GIFs are treated equally - the raw sample values are included
-        using PDF's FlateDecode compression format. JPEGs can be included in
-        their original form using the DCTDecode filter.
+        using PDF's FlateDecode compression format. JPEGs are included in
+        their original form using the DCTDecode filter: the bytes of the JPEG
+        file are embedded as they are, and Pillow only reads the header. CMYK
+        JPEGs, and images whose file can't be read again, are re-encoded.
 
         PNGs with transparency have the alpha channel split out and included as
         an SMask, since PDFs don't natively support transparent PNGs.
@@ -91,25 +196,102 @@ class Image(RectAnnotation):
         :param str|ImageFile image: Either a str representing the path to the
             image filename, or a PIL.ImageFile.ImageFile object representing
             the image loaded using the PIL library.
+        :param bool predictor: compress PNGs and GIFs with PNG predictors,
+            choosing the filter for each row. See section 7.4.4.4 - LZW and
+            Flate Predictor Functions of the PDF 1.7 Spec.
+        :param int compress_level: zlib compression level, 0-9
+        :param bool jpeg_passthrough: embed JPEG files as they are. Only
+            images that haven't been loaded (decoded) yet are embedded this
+            way; once loaded, their pixels may have been changed, e.g. by
+            thumbnail(), so they're re-encoded.
+        :param tuple|None max_size: (width, height) in pixels. Images larger
+            than this in either dimension are downsampled to fit.
         :returns PdfDict: Image XObject
         """
+        return Image.make_xobject(Image.encode_image(
+            image,
+            predictor=predictor,
+            compress_level=compress_level,
+            jpeg_passthrough=jpeg_passthrough,
+            max_size=max_size,
+        ))
+
+    @staticmethod
+    def encode_image(
+        image,
+        predictor=True,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+        jpeg_passthrough=True,
+        max_size=None,
+    ):
+        """Do the work of make_image_xobject - decoding, converting and
+        compressing the image - without building any pdfrw objects. The result
+        is plain data that can be pickled, so this can run in another process.
+        See make_image_xobject for the parameters.
+
+        :returns EncodedImage:
+        """
+        # Images we open ourselves can be modified in place
+        is_own_image = isinstance(image, str)
         image = Image.resolve_image(image)
         # PILImage.convert drops the format attribute
         image_format = image.format
+        if max_size is not None:
+            image = Image.downsample(image, max_size, draft=is_own_image)
         width, height = image.size
 
+        jpeg_data = None
+        if (
+            jpeg_passthrough and
+            isinstance(image, ImageFile) and
+            # Once loaded, the image may no longer match its file, as in
+            # hash_image
+            image.tile and
+            image_format == 'JPEG' and
+            image.mode in (GRAYSCALE_MODE, RGB_MODE)
+        ):
+            jpeg_data = Image.read_jpeg_file(image)
+        # Like libpng, don't filter palette and bilevel images: their samples
+        # are already small, repetitive codes, which filtering only scrambles.
+        predictor = predictor and image.mode not in (
+            PALETTE_MODE,
+            SINGLE_CHANNEL_MODE,
+        )
+
         # Normalize images to RGB or grayscale color spaces, and split out the
         # alpha layer into a PDF smask XObject
-        image, smask_xobj = Image.convert_to_compatible_image(
+        image, smask = Image._convert_to_compatible_image(
             image,
             image_format,
+            predictor=predictor,
+            compress_level=compress_level,
         )
 
+        decode_parms = None
         if image_format in ('PNG', 'GIF'):
-            content = Image.make_compressed_image_content(image)
-            filter_type = 'FlateDecode'  # TODO use a predictor
+            filter_type = 'FlateDecode'
+            if predictor and Image.can_stream_png(image):
+                content = Image.make_streamed_png_content(
+                    image,
+                    compress_level,
+                )
+                decode_parms = Image.get_predictor_parameters(image)
+            elif predictor:
+                content = Image.make_predicted_image_content(
+                    image,
+                    compress_level,
+                )
+                decode_parms = Image.get_predictor_parameters(image)
+            else:
+                content = Image.make_compressed_image_content(
+                    image,
+                    compress_level,
+                )
         elif image_format == 'JPEG':
-            content = Image.make_jpeg_image_content(image)
+            if jpeg_data is not None:
+                content = jpeg_data
+            else:
+                content = Image.make_jpeg_image_content(image)
             filter_type = 'DCTDecode'
         else:
             raise ValueError(
@@ -117,27 +299,103 @@ class Image(RectAnnotation):
                 'PNG, JPEG, and GIF'.format(image.format)
             )
 
+        return EncodedImage(
+            content=content,
+            filter=filter_type,
+            color_space=Image._get_color_space_name(image),
+            width=width,
+            height=height,
+            decode_parms=decode_parms,
+            smask=smask,
+        )
+
+    @staticmethod
+    def make_xobject(encoded):
+        """Build the Image XObject for an image from encode_image.
+
+        :param EncodedImage encoded:
+        :returns PdfDict: Image XObject
+        """
         xobj = PdfDict(
-            stream=content,
+            stream=encoded.content,
             BitsPerComponent=8,
-            Filter=PdfName(filter_type),
-            ColorSpace=Image._get_color_space_name(image),
-            Width=width,
-            Height=height,
+            Filter=PdfName(encoded.filter),
+            ColorSpace=PdfName(encoded.color_space),
+            Width=encoded.width,
+            Height=encoded.height,
             Subtype=PdfName('Image'),
             Type=PdfName('XObject'),
         )
-        if smask_xobj is not None:
-            xobj.SMask = smask_xobj
+        if encoded.decode_parms is not None:
+            xobj.DecodeParms = PdfDict(**encoded.decode_parms)
+        if encoded.smask is not None:
+            xobj.SMask = Image.make_xobject(encoded.smask)
+            xobj.SMask.indirect = True
         return xobj
 
     @staticmethod
-    def convert_to_compatible_image(image, image_format):
+    def downsample(image, max_size, draft=False):
+        """Resample an image so that it's no larger than max_size, if it is.
+        Each dimension is reduced independently, since the image is stretched
+        to fill its box anyway.
+
+        :param PIL.Image image:
+        :param tuple max_size: (width, height) in pixels
+        :param bool draft: let JPEGs be decoded at a fraction of their size,
+            which is much faster than decoding them at full size. This
+            modifies image in place.
+        :returns PIL.Image: image, or a smaller copy of it
+        """
+        width, height = image.size
+        size = (min(width, max_size[0]), min(height, max_size[1]))
+        if size == (width, height):
+            return image
+
+        if draft:
+            image.draft(image.mode, size)
+        if image.mode == PALETTE_MODE:
+            # Palette indices can't be interpolated. Like
+            # convert_to_compatible_image, this drops palette transparency.
+            image = image.convert(RGB_MODE)
+        elif image.mode == SINGLE_CHANNEL_MODE:
+            image = image.convert(GRAYSCALE_MODE)
+        return image.resize(size, PILImage.LANCZOS)
+
+    @staticmethod
+    def convert_to_compatible_image(
+        image,
+        image_format,
+        predictor=True,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+    ):
+        image, smask = Image._convert_to_compatible_image(
+            image,
+            image_format,
+            predictor,
+            compress_level,
+        )
         smask_xobj = None
+        if smask is not None:
+            smask_xobj = Image.make_xobject(smask)
+            smask_xobj.indirect = True
+        return image, smask_xobj
+
+    @staticmethod
+    def _convert_to_compatible_image(
+        image,
+        image_format,
+        predictor=True,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+    ):
+        smask = None
 
         if image_format in ('PNG', 'GIF'):
             if image.mode in (RGBA_MODE, GRAYSCALE_ALPHA_MODE):
-                smask_xobj = Image.get_png_smask(image)
+                smask = Image.encode_png_smask(
+                    image,
+                    predictor,
+                    compress_level,
+                )
 
             # 'P' and 'RGBA' images can just be converted to 'RGB' mode, since
             # alpha layer is preserved in the smask.
@@ -153,25 +411,44 @@ class Image(RectAnnotation):
             # is an easy workaround.
             image = image.convert(RGB_MODE)
 
-        return image, smask_xobj
+        return image, smask
 
     @staticmethod
-    def get_png_smask(image):
-        width, height = image.size
-        smask = Image.make_compressed_image_content(image.getchannel('A'))
-        smask_xobj = PdfDict(
-            stream=smask,
-            Width=width,
-            Height=height,
-            BitsPerComponent=8,
-            Filter=PdfName('FlateDecode'),
-            ColorSpace=PdfName('DeviceGray'),
-            Subtype=PdfName('Image'),
-            Type=PdfName('XObject'),
+    def get_png_smask(
+        image,
+        predictor=True,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+    ):
+        smask_xobj = Image.make_xobject(
+            Image.encode_png_smask(image, predictor, compress_level),
         )
         smask_xobj.indirect = True
         return smask_xobj
 
+    @staticmethod
+    def encode_png_smask(
+        image,
+        predictor=True,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+    ):
+        width, height = image.size
+        alpha = image.getchannel('A')
+        decode_parms = None
+        if predictor:
+            smask = Image.make_predicted_image_content(alpha, compress_level)
+            decode_parms = Image.get_predictor_parameters(alpha)
+        else:
+            smask = Image.make_compressed_image_content(alpha, compress_level)
+        return EncodedImage(
+            content=smask,
+            filter='FlateDecode',
+            color_space='DeviceGray',
+            width=width,
+            height=height,
+            decode_parms=decode_parms,
+            smask=None,
+        )
+
     @staticmethod
     def resolve_image(image_or_filename):
         if isinstance(image_or_filename, str):
@@ -184,49 +461,215 @@ class Image(RectAnnotation):
     @staticmethod
     def _get_color_space_name(image):
         if image.mode == RGB_MODE:
-            return PdfName('DeviceRGB')
+            return 'DeviceRGB'
         elif image.mode in (GRAYSCALE_MODE, SINGLE_CHANNEL_MODE):
-            return PdfName('DeviceGray')
+            return 'DeviceGray'
         raise ValueError('Image color space not yet supported')
 
     @staticmethod
-    def make_compressed_image_content(image):
-        compressed = zlib.compress(Image.get_raw_image_bytes(image))
-        return Image.get_decoded_bytes(compressed)
+    def make_compressed_image_content(
+        image,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+    ):
+        """Compress the image's raw samples, a strip of rows at a time, so
+        that there's never an uncompressed copy of the whole image besides the
+        image itself.
+        """
+        width, height = image.size
+        row_size = width * len(image.getbands())
+        rows_per_strip = max(1, IMAGE_STRIP_SIZE // max(1, row_size))
+        compressor = zlib.compressobj(compress_level)
+        chunks = []
+        for top in range(0, height, rows_per_strip):
+            strip = image.crop((0, top, width, min(top + rows_per_strip, height)))
+            chunks.append(compressor.compress(Image.get_raw_image_bytes(strip)))
+        chunks.append(compressor.flush())
+        return b''.join(chunks)
+
+    @staticmethod
+    def can_stream_png(image):
+        """Whether make_streamed_png_content can encode an image: a PNG that
+        hasn't been decoded yet, read from a file, with 8-bit grayscale or RGB
+        samples that aren't interlaced.
+        """
+        if not (
+            isinstance(image, ImageFile) and
+            image.format == 'PNG' and
+            image.filename and
+            len(image.tile) == 1 and
+            not image.info.get('interlace') and
+            not getattr(image, 'is_animated', False)
+        ):
+            return False
+        rawmode = image.tile[0][3]
+        if isinstance(rawmode, tuple):
+            rawmode = rawmode[0]
+        return image.mode == rawmode and rawmode in (GRAYSCALE_MODE, RGB_MODE)
+
+    @staticmethod
+    def make_streamed_png_content(
+        image,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+    ):
+        """Compress a PNG's samples with PNG predictors, like
+        make_predicted_image_content, without decoding the image. The PNG's
+        own filtered rows are already in the right form, so they're read from
+        its file, decompressed and recompressed a strip at a time. Besides
+        the output, memory use is bounded by the strip size no matter how
+        large the image, e.g. a scanned drawing of 100 megapixels.
+
+        :param ImageFile image: PNG for which can_stream_png is True
+        """
+        decompressor = zlib.decompressobj()
+        compressor = zlib.compressobj(compress_level)
+        chunks = []
+        with open(image.filename, 'rb') as f:
+            for data in _iter_png_image_data(f, IMAGE_STRIP_SIZE):
+                while data:
+                    rows = decompressor.decompress(data, IMAGE_STRIP_SIZE)
+                    chunks.append(compressor.compress(rows))
+                    data = decompressor.unconsumed_tail
+        chunks.append(compressor.compress(decompressor.flush()))
+        chunks.append(compressor.flush())
+        return b''.join(chunks)
+
+    @staticmethod
+    def make_predicted_image_content(
+        image,
+        compress_level=DEFAULT_IMAGE_COMPRESS_LEVEL,
+    ):
+        """Compress the image's samples with PNG predictors, for FlateDecode
+        with the parameters from make_predictor_decode_parms.
+
+        This is exactly the zlib stream in the IDAT chunks of a PNG file, so
+        we let Pillow's PNG encoder do the work. It picks the filter for each
+        row adaptively, from the one whose output looks most compressible.
+        """
+        if image.mode == SINGLE_CHANNEL_MODE:
+            # Otherwise the PNG would have 1 bit per sample, not 8
+            image = image.convert(GRAYSCALE_MODE)
+        if image.mode not in (GRAYSCALE_MODE, RGB_MODE):
+            raise ValueError('Image color space not yet supported')
+
+        png = BytesIO()
+        image.save(png, format='PNG', compress_level=compress_level)
+        return _get_png_image_data(png.getvalue())
+
+    @staticmethod
+    def make_predictor_decode_parms(image):
+        """DecodeParms for image data from make_predicted_image_content."""
+        return PdfDict(**Image.get_predictor_parameters(image))
+
+    @staticmethod
+    def get_predictor_parameters(image):
+        """The entries of make_predictor_decode_parms, as a plain dict."""
+        return dict(
+            # PNG predictors, with the filter chosen per row
+            Predictor=15,
+            Colors=len(image.getbands()),
+            BitsPerComponent=8,
+            Columns=image.size[0],
+        )
+
+    @staticmethod
+    def hash_image(image):
+        """Hash an image's content: the bytes of its file if they can be read,
+        or else its decoded pixels.
+
+        :param str|ImageFile image: see make_image_xobject
+        :returns str: hex digest
+        """
+        if isinstance(image, str):
+            digest = hashlib.sha256()
+            with open(image, 'rb') as f:
+                for data in iter(partial(f.read, IMAGE_STRIP_SIZE), b''):
+                    digest.update(data)
+            return digest.hexdigest()
+
+        image = Image.resolve_image(image)
+        data = None
+        # Once an ImageFile has been loaded (its tiles decoded) its pixels may
+        # have been changed, so the file no longer says what it shows.
+        if image.tile:
+            data = Image.read_image_file(image)
+        if data is None:
+            digest = hashlib.sha256('{} {} {}'.format(
+                image.format,
+                image.mode,
+                image.size,
+            ).encode('ascii'))
+            digest.update(image.tobytes())
+            return digest.hexdigest()
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def read_image_file(image):
+        """Read the original bytes of an image, from the file it was opened
+        from, or the file object it's reading from.
+
+        :param ImageFile image:
+        :returns bytes|None: the image file, or None if it can't be read
+        """
+        try:
+            if image.filename:
+                with open(image.filename, 'rb') as f:
+                    return f.read()
+            elif image.fp is not None:
+                fp = image.fp
+                position = fp.tell()
+                fp.seek(0)
+                data = fp.read()
+                fp.seek(position)
+                return data
+        except (AttributeError, OSError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def read_jpeg_file(image):
+        """Read the original bytes of a JPEG image, see read_image_file.
+
+        :param ImageFile image:
+        :returns bytes|None: the JPEG file, or None if it can't be read
+        """
+        data = Image.read_image_file(image)
+        # Start of image marker
+        if data is None or not data.startswith(b'\xff\xd8'):
+            return None
+        return data
 
     @staticmethod
     def make_jpeg_image_content(image):
         file_obj = BytesIO()
-        # This is the only way to preserve the JPEG encoding. It also seems to
-        # recompress the data, so that the raw bytes of this differ from the
-        # raw bytes of the original file. It'll probably be better to provide a
-        # special wrapper around PILImage that preserves the original bytes so
-        # we can just use those for JPEGs. TODO.
+        # This recompresses the data, so that the raw bytes of this differ
+        # from the raw bytes of the original file. It's only used when those
+        # can't be embedded as they are.
         image.save(file_obj, format='JPEG')
-        return Image.get_decoded_bytes(file_obj.getvalue())
+        return file_obj.getvalue()
 
     @staticmethod
     def get_decoded_bytes(content):
-        # Right now, pdfrw needs strings, not bytes like you'd expect in py3,
-        # for binary stream objects. This might change in future versions.
+        # pdfrw's own writer needs strings, not bytes, for binary stream
+        # objects. Our writers take bytes as they are, so image data no longer
+        # goes through this; it's only kept for callers who use it.
         if sys.version_info.major < 3:
             return content
         return content.decode('Latin-1')
 
     @staticmethod
     def get_raw_image_bytes(image):
-        if image.mode in (GRAYSCALE_MODE, SINGLE_CHANNEL_MODE):
-            # If this is grayscale or single-channel, we can avoid dealing with
-            # the nested tuples in multi-channel images. This bytes/bytearray
-            # wrapped approach is the only way that works in both py2 and py3.
-            return bytes(bytearray(image.getdata()))
-
-        elif image.mode == RGB_MODE:
-            raw_image_data = list(image.getdata())
-            array = bytearray()
-            for rgb in raw_image_data:
-                array.extend(rgb)
-            return bytes(array)
+        """Get the image's samples, 8 bits per component, in the order PDF
+        expects them: rows top to bottom, and each pixel's components
+        interleaved. This is Pillow's own raw layout for 'L' and 'RGB' images,
+        so tobytes copies them out in one step.
+        """
+        if image.mode == SINGLE_CHANNEL_MODE:
+            # Pillow packs bilevel images 8 pixels per byte; expand them to
+            # one 0 or 255 byte per pixel.
+            image = image.convert(GRAYSCALE_MODE)
+
+        if image.mode in (GRAYSCALE_MODE, RGB_MODE):
+            return image.tobytes()
 
         raise ValueError('Image color space not yet supported')
 
@@ -253,3 +696,43 @@ class Image(RectAnnotation):
             Restore(),
         ])
         return stream
+
+
+def _get_png_image_data(png):
+    """Concatenate the data of a PNG file's IDAT chunks, i.e. its compressed,
+    filtered image data.
+
+    :param bytes png: contents of a PNG file
+    :returns bytes:
+    """
+    return b''.join(_iter_png_image_data(BytesIO(png)))
+
+
+def _iter_png_image_data(f, size=None):
+    """Read the data of a PNG file's IDAT chunks, in pieces of at most size
+    bytes.
+
+    :param file f: binary file object, at the start of a PNG file
+    :param int|None size: largest piece to read, or None for whole chunks
+    :returns iterator: of bytes
+    """
+    # 8-byte signature, then chunks of length, type, data, CRC
+    f.seek(8, os.SEEK_CUR)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'IDAT':
+            remaining = length
+            while remaining:
+                data = f.read(remaining if size is None else min(size, remaining))
+                if not data:
+                    raise ValueError('Truncated PNG file')
+                remaining -= len(data)
+                yield data
+        elif chunk_type == b'IEND':
+            return
+        else:
+            f.seek(length, os.SEEK_CUR)
+        f.seek(4, os.SEEK_CUR)
@@ -12,6 +12,7 @@ from pdf_annotate.annotations.base import make_border_dict
 from pdf_annotate.config.appearance import set_appearance_state
 from pdf_annotate.config.appearance import stroke_or_fill
 from pdf_annotate.graphics import Close
+from pdf_annotate.graphics import CompactContentStream
 from pdf_annotate.graphics import ContentStream
 from pdf_annotate.graphics import Line as CSLine
 from pdf_annotate.graphics import Move
@@ -83,11 +84,10 @@ class Polygon(PointsAnnotation):
         A = self._appearance
         points = self._location.points
 
-        stream = ContentStream([Save()])
+        stream = CompactContentStream([Save()])
         set_appearance_state(stream, A)
         stream.add(Move(points[0][0], points[0][1]))
-        for x, y in points[1:]:
-            stream.add(CSLine(x, y))
+        stream.extend(CSLine(x, y) for x, y in points[1:])
         stream.add(Close())
         stroke_or_fill(stream, A)
         stream.add(Restore())
@@ -108,11 +108,10 @@ class Polyline(PointsAnnotation):
         A = self._appearance
         points = self._location.points
 
-        stream = ContentStream([Save()])
+        stream = CompactContentStream([Save()])
         set_appearance_state(stream, A)
         stream.add(Move(points[0][0], points[0][1]))
-        for x, y in points[1:]:
-            stream.add(CSLine(x, y))
+        stream.extend(CSLine(x, y) for x, y in points[1:])
         # TODO add a 'close' attribute?
         stream.extend([Stroke(), Restore()])
 
@@ -129,13 +128,12 @@ class Ink(PointsAnnotation):
         A = self._appearance
         points = self._location.points
 
-        stream = ContentStream([Save()])
+        stream = CompactContentStream([Save()])
         set_appearance_state(stream, A)
         stream.add(Move(points[0][0], points[0][1]))
         # TODO "real" PDF editors do smart smoothing of ink points using
         # interpolated Bezier curves.
-        for x, y in points[1:]:
-            stream.add(CSLine(x, y))
+        stream.extend(CSLine(x, y) for x, y in points[1:])
         stream.extend([Stroke(), Restore()])
 
         return stream
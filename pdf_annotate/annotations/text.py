@@ -8,6 +8,7 @@
     :license: MIT, see LICENSE for details.
 """
 import os.path
+from functools import partial
 
 from pdfrw import IndirectPdfDict
 from pdfrw import PdfArray
@@ -31,7 +32,7 @@ from pdf_annotate.graphics import Save
 from pdf_annotate.graphics import Text
 from pdf_annotate.graphics import TextMatrix
 from pdf_annotate.util.geometry import translate
-from pdf_annotate.util.text import get_wrapped_lines
+from pdf_annotate.util.text import get_line_breaks
 from pdf_annotate.util.true_type_font import get_true_type_font
 
 
@@ -85,8 +86,8 @@ class FreeText(Annotation):
         with open(tt_font.ttfPath, 'rb') as font_file:
             data = font_file.read()
 
-        # Let's let pdfrw handle compressing streams
-        return IndirectPdfDict(stream=data.decode('Latin-1'))
+        # The writer compresses the stream, and writes the bytes as they are
+        return IndirectPdfDict(stream=data)
 
     @staticmethod
     def make_to_unicode_object():
@@ -130,18 +131,17 @@ class FreeText(Annotation):
         """
         # Let's make this as large as possibly addressable for now, it will compress nicely.
         mapping_size = 256 * 256
-        cid_to_gid_map = ["\x00"] * mapping_size * 2
+        cid_to_gid_map = bytearray(mapping_size * 2)
 
         for cc, glyph_name in tt_font.metrics.cmap.items():
             # TODO: What is the expectation here since PDF only supports two bytes lookups?
             if cc >= mapping_size:
                 continue
             glyph_id = tt_font.get_glyph_id(glyph_name)
-            cid_to_gid_map[cc * 2] = chr(glyph_id >> 8)
-            cid_to_gid_map[cc * 2 + 1] = chr(glyph_id & 0xFF)
-        cid_to_gid_map = ''.join(cid_to_gid_map)
+            cid_to_gid_map[cc * 2] = glyph_id >> 8
+            cid_to_gid_map[cc * 2 + 1] = glyph_id & 0xFF
 
-        # Let's let pdfrw handle the compressing of streams
+        # The writer compresses the stream, and writes the bytes as they are
         return IndirectPdfDict(stream=cid_to_gid_map)
 
     @staticmethod
@@ -239,7 +239,10 @@ class FreeText(Annotation):
 
     def add_additional_resources(self, resources):
         font_dict = PdfDict()
-        font_dict[PdfName(PDF_ANNOTATOR_FONT)] = self.make_font_object()
+        font_dict[PdfName(PDF_ANNOTATOR_FONT)] = self._document_resources.get_font(
+            DEFAULT_BASE_FONT,
+            self.make_font_object,
+        )
         resources[PdfName('Font')] = font_dict
 
     def make_appearance_stream(self):
@@ -297,17 +300,19 @@ def get_text_commands(
     :param str baseline: 'top'|'middle'|'bottom'
     :param number line_spacing: multiplier to determine line spacing
     """
-    font = get_true_type_font(
-        path=HELVETICA_PATH,
-        font_name=DEFAULT_BASE_FONT,
-        font_size=font_size,
-    )
-
-    lines = get_wrapped_lines(
-        text=text,
-        measure=font.measure_text,
-        max_length=x2 - x1,
-    ) if wrap_text else [text]
+    # The font is shared by all sizes, so it's given font_size explicitly
+    font = get_true_type_font(path=HELVETICA_PATH, font_name=DEFAULT_BASE_FONT)
+
+    if wrap_text:
+        breaks = get_line_breaks(
+            text=text,
+            widths=font.get_advance_widths(text),
+            max_length=x2 - x1,
+            scale=partial(font.scale_width, font_size=font_size),
+        )
+        lines = [text[start:end] for start, end in breaks]
+    else:
+        lines = [text]
     # Line breaking cares about the whitespace in the string, but for the
     # purposes of laying out the broken lines, we want to measure the lines
     # without trailing/leading whitespace.
@@ -320,7 +325,13 @@ def get_text_commands(
         line_spacing,
         baseline,
     )
-    xs = _get_horizontal_coordinates(lines, x1, x2, font.measure_text, align)
+    xs = _get_horizontal_coordinates(
+        lines,
+        x1,
+        x2,
+        partial(font.measure_many, font_size=font_size),
+        align,
+    )
     commands = []
     for line, x, y in zip(lines, xs, y_coords):
         commands.extend([
@@ -358,7 +369,7 @@ def _get_vertical_coordinates(
     return [first_y - (i * line_spacing) for i in range(len(lines))]
 
 
-def _get_horizontal_coordinates(lines, x1, x2, measure, align):
+def _get_horizontal_coordinates(lines, x1, x2, measure_many, align):
     # NOTE: this padding is to keep text annotations as they are from cutting
     # off text at the edges in certain conditions. The annotation rectangle
     # and how PDFs draw text needs to be revisited, as this padding shouldn't
@@ -367,10 +378,10 @@ def _get_horizontal_coordinates(lines, x1, x2, measure, align):
     if align == 'left':
         return [x1 + PADDING for _ in range(len(lines))]
     elif align == 'center':
-        widths = [measure(line) for line in lines]
+        widths = measure_many(lines)
         max_width = x2 - x1
         return [x1 + ((max_width - width) / 2.0) - PADDING for width in widths]
     else:  # right
-        widths = [measure(line) for line in lines]
+        widths = measure_many(lines)
         max_width = x2 - x1
         return [x1 + (max_width - width) - PADDING for width in widths]
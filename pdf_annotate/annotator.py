@@ -7,10 +7,14 @@
     :copyright: Copyright 2019 Autodesk, Inc.
     :license: MIT, see LICENSE for details.
 """
+import mmap
+import os
 import warnings
+from collections import namedtuple
+from collections import OrderedDict
+from functools import partial
 
 from pdfrw import PdfReader
-from pdfrw import PdfWriter
 
 from pdf_annotate.annotations.image import Image
 from pdf_annotate.annotations.points import Ink
@@ -24,14 +28,22 @@ from pdf_annotate.config.metadata import Metadata
 from pdf_annotate.config.metadata import UNSET
 from pdf_annotate.graphics import ContentStream
 from pdf_annotate.util.geometry import identity
+from pdf_annotate.util.geometry import matrix_inverse
 from pdf_annotate.util.geometry import matrix_multiply
 from pdf_annotate.util.geometry import normalize_rotation
 from pdf_annotate.util.geometry import rotate
 from pdf_annotate.util.geometry import scale
 from pdf_annotate.util.geometry import translate
+from pdf_annotate.util.incremental_writer import IncrementalWriter
+from pdf_annotate.util.incremental_writer import uses_xref_streams
+from pdf_annotate.util.lazy_reader import LazyPdfReader
+from pdf_annotate.util.pdf_writer import DocumentWriter
+from pdf_annotate.util.resources import DocumentResources
 from pdf_annotate.util.validation import NUMERIC_TYPES
 
 
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
 NAME_TO_ANNOTATION = {
     'square': Square,
     'circle': Circle,
@@ -43,6 +55,16 @@ NAME_TO_ANNOTATION = {
     'image': Image,
 }
 
+# Everything about a page that's needed to place annotations on it, computed
+# once per page by PdfAnnotator._get_page_geometry.
+PageGeometry = namedtuple('PageGeometry', [
+    'bounding_box',
+    'rotation',
+    'scale',
+    'transform',
+    'inverse_transform',
+])
+
 
 class PDF(object):
 
@@ -66,26 +88,76 @@ class PDF(object):
 
 
 class PdfAnnotator(object):
+    """Annotates one PDF document.
+
+    Separate PdfAnnotators, e.g. one per request in a threaded service, can be
+    used concurrently from different threads: everything from loading the PDF
+    to adding annotations and writing the result only touches state that
+    belongs to the annotator, and the font caches they share are thread-safe.
+    A single PdfAnnotator is not thread-safe; to add annotations to one
+    document from several threads, serialize the calls with a lock.
+    """
 
-    def __init__(self, file_or_reader, scale=None, compress=True):
+    def __init__(self, file_or_reader, scale=None, compress=True, lazy=False):
         """Draw annotations directly on PDFs. Annotations are always drawn on
         as if you're drawing them in a viewer, i.e. they take into account page
         rotation and weird, translated coordinate spaces.
 
-        :param str|PdfReader file_or_reader: filename of PDF or pdfrw.PdfReader
+        :param str|bytes|memoryview|mmap|PdfReader file_or_reader: filename
+            of PDF, a buffer holding the PDF's bytes, or pdfrw.PdfReader.
+            Files are memory-mapped rather than read into memory.
         :param number|tuple|None scale: number by which to scale coordinates
             to get to default user space. Use this if, for example, your points
             in the coordinate space of the PDF viewed at a dpi. In this case,
             scale would be 72/dpi. Can also specify a 2-tuple of x and y scale.
         :param bool compress: whether to output flate-compressed PDFs
+        :param bool lazy: unless file_or_reader is a PdfReader, load the page
+            tree and page objects only as pages are accessed, instead of all
+            of them up front. Use this for large documents where only a few
+            pages get annotated.
         """
+        self._filename = None
+        # Original bytes of the PDF, if we have them, and whether we mapped
+        # them ourselves (and so need to close them).
+        self._source = None
+        self._owns_source = False
         if isinstance(file_or_reader, str):
-            file_or_reader = PdfReader(file_or_reader)
+            self._filename = file_or_reader
+            self._source = self._map_file(file_or_reader)
+            self._owns_source = isinstance(self._source, mmap.mmap)
+        elif isinstance(file_or_reader, BUFFER_TYPES):
+            self._source = file_or_reader
+
+        if self._source is not None:
+            reader_cls = LazyPdfReader if lazy else PdfReader
+            # pdfrw parses Latin-1 strs. Decoding straight from the buffer
+            # avoids holding both a bytes and a str copy of the document.
+            file_or_reader = reader_cls(fdata=str(self._source, 'Latin-1'))
         self._pdf = PDF(file_or_reader)
         self._scale = self._expand_scale(scale)
         self._dimensions = {}
+        self._page_geometry = {}
+        # Objects read from the source PDF that annotating has modified, keyed
+        # by id. Used to write incremental updates.
+        self._modified_objects = OrderedDict()
+        # Fonts etc. shared by all the annotations added to the document
+        self._resources = DocumentResources()
         self._compress = compress
 
+    @staticmethod
+    def _map_file(filename):
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files can't be mapped; let pdfrw complain instead.
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _release_source(self):
+        if self._owns_source:
+            self._source.close()
+        self._source = None
+        self._owns_source = False
+
     def _expand_scale(self, scale):
         if scale is None:
             return 1, 1
@@ -106,6 +178,37 @@ class PdfAnnotator(object):
         :param int page_number:
         """
         self._dimensions[page_number] = dimensions
+        self.clear_page_geometry(page_number)
+
+    def clear_page_geometry(self, page_number=None):
+        """Drop cached page geometry (bounding box, rotation, scale and
+        transforms). The cache is invalidated automatically by
+        set_page_dimensions; call this if you modify a page's boxes or Rotate
+        entry directly.
+
+        :param int|None page_number: page to clear, or None to clear all pages
+        """
+        if page_number is None:
+            self._page_geometry.clear()
+        else:
+            self._page_geometry.pop(page_number, None)
+
+    def _get_page_geometry(self, page_number):
+        geometry = self._page_geometry.get(page_number)
+        if geometry is None:
+            bounding_box = self.get_page_bounding_box(page_number)
+            rotation = self._pdf.get_rotation(page_number)
+            _scale = self._get_scale(page_number, bounding_box, rotation)
+            transform = self._get_transform(bounding_box, rotation, _scale)
+            geometry = PageGeometry(
+                bounding_box=bounding_box,
+                rotation=rotation,
+                scale=_scale,
+                transform=transform,
+                inverse_transform=matrix_inverse(transform),
+            )
+            self._page_geometry[page_number] = geometry
+        return geometry
 
     def get_page_bounding_box(self, page_number):
         page = self._pdf.get_page(page_number)
@@ -128,8 +231,9 @@ class PdfAnnotator(object):
             be (height, width) in PDF user space. Otherwise the returned value
             will be (width, height).
         """
-        x1, y1, x2, y2 = self.get_page_bounding_box(page_number)
-        rotation = self._pdf.get_rotation(page_number)
+        geometry = self._get_page_geometry(page_number)
+        x1, y1, x2, y2 = geometry.bounding_box
+        rotation = geometry.rotation
 
         if rotation in (0, 180):
             return (abs(x2 - x1), abs(y2 - y1))
@@ -166,6 +270,120 @@ class PdfAnnotator(object):
         )
         self._add_annotation(annotation)
 
+    def add_annotations(self, annotations, executor=None):
+        """Add many annotations at once. Annotations are grouped by page, so
+        that the page's transform is computed once per page rather than once
+        per annotation, and each page's Annots array is extended in one step.
+
+        An annotation that fails to build doesn't abort the batch; its error
+        is reported in the returned list instead.
+
+        :param iterable annotations: iterable of (annotation_type, location,
+            appearance) or (annotation_type, location, appearance, metadata)
+            tuples, with the same meaning as the add_annotation arguments.
+        :param concurrent.futures.Executor|None executor: if given, the images
+            of image annotations are decoded, converted and compressed on it,
+            concurrently, before any annotation is added. Both thread and
+            process pools work: Pillow and zlib release the GIL while they
+            work. The resulting document is the same as without an executor.
+        :returns list: (index, exception) tuples for every item that could
+            not be added, ordered by index. Empty if all items were added.
+        """
+        failures = []
+        by_page = OrderedDict()
+        validated_types = set()
+        for index, item in enumerate(annotations):
+            try:
+                annotation = self._build_annotation(
+                    item,
+                    by_page,
+                    validated_types,
+                )
+            except Exception as e:
+                failures.append((index, e))
+                continue
+            by_page[annotation.page].append((index, annotation))
+
+        if executor is not None:
+            self._encode_images(by_page, executor)
+
+        for page_number, items in by_page.items():
+            page = self._pdf.get_page(page_number)
+            transform = self._get_page_geometry(page_number).transform
+            annotation_objs = []
+            for index, annotation in items:
+                try:
+                    annotation_objs.append(
+                        annotation.as_pdf_object(
+                            transform,
+                            page,
+                            self._resources,
+                        ),
+                    )
+                except Exception as e:
+                    failures.append((index, e))
+            self._append_annotation_objects(page, annotation_objs)
+
+        failures.sort(key=lambda failure: failure[0])
+        return failures
+
+    def _encode_images(self, by_page, executor):
+        """Encode the images of the Image annotations in by_page on executor,
+        and register their XObjects with the document's resources, where
+        as_pdf_object will find them.
+        """
+        futures = OrderedDict()
+        for page_number, items in by_page.items():
+            transform = self._get_page_geometry(page_number).transform
+            for _, annotation in items:
+                if not isinstance(annotation, Image):
+                    continue
+                try:
+                    annotation.fit_to(transform)
+                    key = annotation.get_image_key()
+                except Exception:
+                    # as_pdf_object raises this again, and it's reported then
+                    continue
+                if key in futures or self._resources.has_image(key):
+                    continue
+                futures[key] = executor.submit(
+                    Image.encode_image,
+                    **annotation.get_image_arguments()
+                )
+
+        # Register the results in the order they were submitted, rather than
+        # as they complete, so the document doesn't depend on scheduling.
+        for key, future in futures.items():
+            try:
+                encoded = future.result()
+            except Exception:
+                # Left unregistered, so as_pdf_object encodes the image itself
+                # and reports the error for each annotation that shows it.
+                continue
+            self._resources.get_image(key, partial(Image.make_xobject, encoded))
+
+    def _build_annotation(self, item, seen_pages, validated_types):
+        annotation_type, location, appearance = item[:3]
+        metadata = item[3] if len(item) > 3 else None
+        if location.page not in seen_pages:
+            self._before_add(location)
+            seen_pages[location.page] = []
+        metadata = self._resolve_metadata(metadata)
+        # Every item has its own appearance, so this is checked per item
+        self._validate_appearance_stream(appearance)
+        annotation = self._make_annotation(
+            annotation_type,
+            location,
+            appearance,
+            metadata,
+        )
+        # validate checks the annotation type against the document's PDF
+        # version, which is the same for every annotation of a type.
+        if annotation_type not in validated_types:
+            annotation.validate(self._pdf.pdf_version)
+            validated_types.add(annotation_type)
+        return annotation
+
     @staticmethod
     def _resolve_metadata(metadata):
         if isinstance(metadata, Metadata):
@@ -194,16 +412,24 @@ class PdfAnnotator(object):
             )
 
     def get_annotation(self, annotation_type, location, appearance, metadata):
+        annotation = self._make_annotation(
+            annotation_type,
+            location,
+            appearance,
+            metadata,
+        )
+        annotation.validate(self._pdf.pdf_version)
+        return annotation
+
+    @staticmethod
+    def _make_annotation(annotation_type, location, appearance, metadata):
         # TODO filter on valid PDF versions, by type
         annotation_cls = NAME_TO_ANNOTATION.get(annotation_type)
         if annotation_cls is None:
             raise ValueError('Invalid/unsupported annotation type: {}'.format(
                 annotation_type
             ))
-
-        annotation = annotation_cls(location, appearance, metadata)
-        annotation.validate(self._pdf.pdf_version)
-        return annotation
+        return annotation_cls(location, appearance, metadata)
 
     def get_scale(self, page_number):
         """Public API to get the x and y scales of the given page.
@@ -211,9 +437,7 @@ class PdfAnnotator(object):
         :param int page_number:
         :returns 2-tuple: (x_scale, y_scale)
         """
-        rotation = self._pdf.get_rotation(page_number)
-        bounding_box = self.get_page_bounding_box(page_number)
-        return self._get_scale(page_number, bounding_box, rotation)
+        return self._get_page_geometry(page_number).scale
 
     def get_rotation(self, page_number):
         """Public API to get the rotation of the give page.
@@ -243,9 +467,21 @@ class PdfAnnotator(object):
         return x_scale, y_scale
 
     def get_transform(self, page_number, rotation):
-        bounding_box = self.get_page_bounding_box(page_number)
-        _scale = self._get_scale(page_number, bounding_box, rotation)
-        return self._get_transform(bounding_box, rotation, _scale)
+        geometry = self._get_page_geometry(page_number)
+        if rotation == geometry.rotation:
+            return list(geometry.transform)
+        _scale = self._get_scale(page_number, geometry.bounding_box, rotation)
+        return self._get_transform(geometry.bounding_box, rotation, _scale)
+
+    def get_inverse_transform(self, page_number):
+        """Get the transformation from PDF user space back to the client's
+        coordinate space for the given page, i.e. the inverse of the transform
+        applied to annotations added to that page.
+
+        :param int page_number:
+        :returns list: 6-item transformation matrix
+        """
+        return list(self._get_page_geometry(page_number).inverse_transform)
 
     @staticmethod
     def _get_transform(bounding_box, rotation, _scale):
@@ -294,27 +530,110 @@ class PdfAnnotator(object):
         metadata and content stream to PDF user space.
         """
         page = self._pdf.get_page(annotation.page)
-        transform = self.get_transform(
-            annotation.page,
-            self._pdf.get_rotation(annotation.page),
+        transform = self._get_page_geometry(annotation.page).transform
+        annotation_obj = annotation.as_pdf_object(
+            transform,
+            page,
+            self._resources,
         )
-        annotation_obj = annotation.as_pdf_object(transform, page)
+        self._append_annotation_objects(page, [annotation_obj])
 
+    def _append_annotation_objects(self, page, annotation_objs):
+        if not annotation_objs:
+            return
         if page.Annots:
-            page.Annots.append(annotation_obj)
+            page.Annots.extend(annotation_objs)
+            # If the Annots array is its own indirect object, only the array
+            # has changed, not the page.
+            modified = page.Annots
+            if not isinstance(getattr(modified, 'indirect', False), tuple):
+                modified = page
         else:
-            page.Annots = [annotation_obj]
-
-    def write(self, filename=None, overwrite=False):
+            page.Annots = annotation_objs
+            modified = page
+        self._modified_objects[id(modified)] = modified
+
+    def write(self, filename=None, overwrite=False, incremental=False):
+        """Write the annotated PDF.
+
+        :param str|file|None filename: output filename, or a binary file-like
+            object with a write method (e.g. BytesIO, a pipe, or a socket's
+            makefile('wb')). Both full and incremental writes go to it one
+            object at a time, as each is formatted, with no temporary file or
+            seeking; incremental writes copy the original bytes in chunks
+            first. It's left open.
+        :param bool overwrite: write to the file the annotator was opened
+            from. Passing that file's path as filename does the same.
+        :param bool incremental: write an incremental update, i.e. the
+            original bytes of the PDF followed by only the new annotation
+            objects, modified page objects and a new cross-reference section.
+            This makes writing time proportional to the number of annotations
+            instead of the size of the document. With overwrite, the update is
+            appended to the original file in place. Documents that use
+            cross-reference streams or object streams, as most PDF 1.5+ files
+            do, are written in full instead, with a warning.
+        """
         if filename is None and not overwrite:
             raise ValueError(
                 'Must specify either output filename or overwrite flag'
             )
         if overwrite:
+            if self._filename is None:
+                raise ValueError(
+                    'Cannot overwrite a PDF that was not opened from a file'
+                )
             filename = self._filename
+        elif self._is_source_file(filename):
+            # Writing over the source file, which may be memory-mapped, is an
+            # overwrite whether or not it was asked for by name.
+            overwrite = True
+
+        if incremental and uses_xref_streams(self._pdf._reader):
+            warnings.warn(
+                'Cannot write an incremental update of a PDF with '
+                'cross-reference streams or object streams; writing the '
+                'whole document instead'
+            )
+            incremental = False
 
-        writer = PdfWriter(
+        if incremental:
+            self._write_incremental(filename, append=overwrite)
+            return
+
+        if overwrite:
+            # The source file is about to be truncated, so its mapping can't
+            # be used anymore.
+            self._release_source()
+
+        writer = DocumentWriter(
+            self._pdf._reader,
             version=self._pdf.pdf_version,
             compress=self._compress,
         )
-        writer.write(fname=filename, trailer=self._pdf._reader)
+        if hasattr(filename, 'write'):
+            writer.write(filename)
+        else:
+            with open(filename, 'wb') as f:
+                writer.write(f)
+
+    def _is_source_file(self, filename):
+        if self._filename is None or not isinstance(filename, str):
+            return False
+        try:
+            return os.path.samefile(filename, self._filename)
+        except OSError:
+            # One of them doesn't exist
+            return False
+
+    def _write_incremental(self, filename, append):
+        writer = IncrementalWriter(self._pdf._reader, compress=self._compress)
+        modified = list(self._modified_objects.values())
+        if hasattr(filename, 'write'):
+            writer.write(filename, modified, source=self._source)
+        elif append:
+            with open(filename, 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                writer.write_update(f, modified, f.tell())
+        else:
+            with open(filename, 'wb') as f:
+                writer.write(f, modified, source=self._source)
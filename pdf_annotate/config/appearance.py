@@ -17,6 +17,7 @@ from pdf_annotate.config.constants import BLACK
 from pdf_annotate.config.constants import DEFAULT_BORDER_STYLE
 from pdf_annotate.config.constants import DEFAULT_CONTENT
 from pdf_annotate.config.constants import DEFAULT_FONT_SIZE
+from pdf_annotate.config.constants import DEFAULT_IMAGE_COMPRESS_LEVEL
 from pdf_annotate.config.constants import DEFAULT_LINE_SPACING
 from pdf_annotate.config.constants import DEFAULT_STROKE_WIDTH
 from pdf_annotate.config.constants import GRAPHICS_STATE_NAME
@@ -35,6 +36,7 @@ from pdf_annotate.util.validation import Boolean
 from pdf_annotate.util.validation import Color
 from pdf_annotate.util.validation import Enum
 from pdf_annotate.util.validation import Field
+from pdf_annotate.util.validation import Integer
 from pdf_annotate.util.validation import Number
 from pdf_annotate.util.validation import positive
 from pdf_annotate.util.validation import String
@@ -74,6 +76,18 @@ class Appearance(object):
 
     # Image attributes
     image = String(default=None)
+    # Compress PNGs and GIFs with PNG predictors, which shrinks drawings and
+    # screenshots a lot
+    image_predictor = Boolean(default=True)
+    image_compress_level = Integer(
+        default=DEFAULT_IMAGE_COMPRESS_LEVEL,
+        validator=between(0, 9),
+    )
+    # Embed JPEG files as they are, instead of decoding and re-encoding them
+    image_jpeg_passthrough = Boolean(default=True)
+    # Downsample images with more pixels per inch than this, at the size
+    # they're drawn on the page. None keeps images at full resolution.
+    image_max_dpi = Number(default=None, validator=positive)
 
     # Advanced attributes
     appearance_stream = Field(ContentStream, default=None)
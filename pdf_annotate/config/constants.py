@@ -63,3 +63,8 @@ PALETTE_MODE = 'P'
 GRAYSCALE_MODE = 'L'
 GRAYSCALE_ALPHA_MODE = 'LA'
 SINGLE_CHANNEL_MODE = '1'
+
+# zlib compression level (0-9) of Flate-compressed images
+DEFAULT_IMAGE_COMPRESS_LEVEL = 6
+# Bytes of uncompressed image samples to convert and compress at a time
+IMAGE_STRIP_SIZE = 1 << 20
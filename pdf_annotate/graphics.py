@@ -8,14 +8,21 @@
 """
 from __future__ import division
 
+import re
+from array import array
 from collections import namedtuple
+from decimal import Decimal
 from functools import total_ordering
 
 from pdf_annotate.util.geometry import matrix_multiply
 from pdf_annotate.util.geometry import transform_point
+from pdf_annotate.util.geometry import transform_points_at
 from pdf_annotate.util.geometry import transform_vector
 
-ZERO_TOLERANCE = 0.00000000000001
+# Default number of decimal places used when writing numbers
+DEFAULT_PRECISION = 10
+# Size of the reads parse_content_stream makes from file objects
+PARSE_CHUNK_SIZE = 64 * 1024
 
 
 class ContentStream(object):
@@ -70,6 +77,19 @@ class ContentStream(object):
             command.resolve() for command in self.commands
         )
 
+    def compact(self):
+        """Return a CompactContentStream with the same commands."""
+        return CompactContentStream(self.commands)
+
+    @classmethod
+    def parse(cls, data):
+        """Make a content stream from raw PDF content stream data, e.g. an
+        existing appearance stream. See parse_content_stream.
+        """
+        stream = cls()
+        stream.extend(parse_content_stream(data))
+        return stream
+
     @staticmethod
     def join(stream1, stream2):
         """Combine two content streams."""
@@ -385,21 +405,521 @@ class CTM(metaclass=MatrixCommand):
     COMMAND = 'cm'
 
 
-def format_number(n):
-    # Really small numbers should just be rounded to 0
-    if -ZERO_TOLERANCE <= n <= ZERO_TOLERANCE:
-        return '0'
-    # Cut off unnecessary decimals
+class RawCommand(BaseCommand):
+    """An operator that has no command class, with its operands kept as the
+    PDF tokens they were parsed from, e.g. RawCommand(['0', '-12'], 'Td').
+
+    Raw commands are written out verbatim and are not transformed.
+    """
+
+    def __init__(self, operands, command):
+        self.operands = list(operands)
+        self.command = command
+
+    def __repr__(self):
+        return 'RawCommand({!r}, {!r})'.format(self.operands, self.command)
+
+    def resolve(self):
+        return ' '.join(self.operands + [self.command])
+
+
+class CompactContentStream(ContentStream):
+    """A ContentStream that stores its commands in flat arrays - one opcode
+    per command, and all the commands' numeric operands in a single float
+    buffer - rather than as a list of command objects.
+
+    Commands are still added with the usual command classes, e.g.
+
+        stream = CompactContentStream([Save(), Move(1, 2), Line(3, 4)])
+
+    but they're only materialized again if `commands` is accessed. This makes
+    streams with many commands, like Ink annotations with thousands of points,
+    much cheaper to store, transform and resolve.
+    """
+
+    def __init__(self, commands=None):
+        self._opcodes = array('B')
+        self._numbers = array('d')
+        # Non-numeric operands, e.g. font names and text; also holds command
+        # objects of classes that have no opcode.
+        self._strings = []
+        # Positions in _numbers of the operands transform needs to touch: the
+        # x of every point and vector, and the start of every matrix. Also
+        # the positions in _strings of commands without an opcode.
+        self._point_indices = array('q')
+        self._vector_indices = array('q')
+        self._matrix_indices = array('q')
+        self._opaque_indices = array('q')
+        if commands:
+            self.extend(commands)
+
+    def __len__(self):
+        return len(self._opcodes)
+
+    @property
+    def commands(self):
+        commands = []
+        numbers = self._numbers
+        strings = iter(self._strings)
+        n = 0
+        for opcode in self._opcodes:
+            op = _OPS[opcode]
+            if op.kind == _OPAQUE:
+                commands.append(next(strings))
+                continue
+            args = [next(strings) for _ in range(op.num_strings)]
+            args.extend(numbers[n:n + op.num_numbers])
+            n += op.num_numbers
+            commands.append(op.decode(args))
+        return commands
+
+    def add(self, command):
+        opcode = _OPCODES.get(command.__class__)
+        if opcode is None:
+            self._opcodes.append(_OPAQUE_OPCODE)
+            self._opaque_indices.append(len(self._strings))
+            self._strings.append(command)
+            return
+        op = _OPS[opcode]
+        self._opcodes.append(opcode)
+        strings, numbers = op.encode(command)
+        if strings:
+            self._strings.extend(strings)
+        if numbers:
+            n = len(self._numbers)
+            self._numbers.extend(numbers)
+            if op.kind == _POINTS:
+                self._point_indices.extend(range(n, n + op.num_numbers, 2))
+            elif op.kind == _RECT:
+                self._point_indices.append(n)
+                self._vector_indices.append(n + 2)
+            elif op.kind == _MATRIX:
+                self._matrix_indices.append(n)
+
+    def extend(self, commands):
+        for command in commands:
+            self.add(command)
+
+    def transform(self, transform):
+        """Transform all the stream's points, vectors and matrices at once,
+        without creating any command objects.
+        """
+        numbers = array('d', self._numbers)
+        transform_points_at(numbers, self._point_indices, transform)
+        transform_points_at(numbers, self._vector_indices, transform, vectors=True)
+        for i in self._matrix_indices:
+            numbers[i:i + 6] = array(
+                'd', matrix_multiply(transform, numbers[i:i + 6]),
+            )
+        strings = list(self._strings)
+        for i in self._opaque_indices:
+            strings[i] = strings[i].transform(transform)
+
+        stream = CompactContentStream()
+        stream._opcodes = array('B', self._opcodes)
+        stream._numbers = numbers
+        stream._strings = strings
+        stream._point_indices = array('q', self._point_indices)
+        stream._vector_indices = array('q', self._vector_indices)
+        stream._matrix_indices = array('q', self._matrix_indices)
+        stream._opaque_indices = array('q', self._opaque_indices)
+        return stream
+
+    def resolve(self):
+        return self.to_bytes().decode('Latin-1')
+
+    def to_bytes(self):
+        """Serialize the stream in a single pass over the opcode array.
+
+        :returns bytearray:
+        """
+        formatted = format_numbers(self._numbers)
+        strings = self._strings
+        tokens = []
+        n = 0
+        s = 0
+        for opcode in self._opcodes:
+            op = _OPS[opcode]
+            if op.kind == _OPAQUE:
+                tokens.append(strings[s].resolve())
+                s += 1
+                continue
+            if op.num_strings:
+                tokens.append(op.format_string(strings[s]))
+                s += 1
+            if op.num_numbers:
+                tokens.extend(formatted[n:n + op.num_numbers])
+                n += op.num_numbers
+            tokens.append(op.command)
+        return bytearray(' '.join(tokens), 'Latin-1')
+
+
+# Operand kinds, which determine how CompactContentStream transforms them
+_STATIC = 0  # numbers are left untouched
+_POINTS = 1  # numbers are (x, y) pairs of points
+_RECT = 2  # numbers are a point followed by a vector
+_MATRIX = 3  # numbers are a 6-item matrix
+_OPAQUE = 4  # command object without an opcode, stored as is
+
+
+class _Op(namedtuple('_Op', ['cls', 'command', 'kind', 'num_numbers', 'num_strings'])):
+
+    def encode(self, command):
+        """Return the (strings, numbers) operands of a command object."""
+        cls = self.cls
+        if cls is Font:
+            return [command.font], [command.font_size]
+        elif self.num_strings:
+            return list(command), None
+        elif self.kind == _MATRIX:
+            return None, command.matrix
+        elif self.num_numbers:
+            return None, command
+        return None, None
+
+    def decode(self, args):
+        """Make a command object from its operands."""
+        if self.kind == _MATRIX:
+            return self.cls(list(args))
+        return self.cls(*args)
+
+    def format_string(self, string):
+        if self.cls is Text:
+            # PDFs require backslashes to be escaped
+            return '({})'.format(string.replace('\\', '\\\\'))
+        return '/{}'.format(string)
+
+
+def _make_op(cls, kind=_STATIC, num_strings=0):
+    num_numbers = cls.NUM_ARGS - num_strings
+    # ReadOnlyFill resolves as Fill
+    command = cls.resolve(cls()) if cls.NUM_ARGS == 0 else cls.COMMAND
+    return _Op(cls, command, kind, num_numbers, num_strings)
+
+
+_OPS = [
+    _make_op(StrokeColor),
+    _make_op(StrokeWidth),
+    _make_op(FillColor),
+    _make_op(BeginText),
+    _make_op(EndText),
+    _make_op(Stroke),
+    _make_op(CloseAndStroke),
+    _make_op(StrokeAndFill),
+    _make_op(StrokeAndFillEvenOdd),
+    _make_op(Fill),
+    _make_op(ReadOnlyFill),
+    _make_op(FillEvenOdd),
+    _make_op(CloseFillAndStroke),
+    _make_op(CloseFillAndStrokeEvenOdd),
+    _make_op(EndPath),
+    _make_op(Save),
+    _make_op(Restore),
+    _make_op(Close),
+    _make_op(Font, num_strings=1),
+    _make_op(Text, num_strings=1),
+    _make_op(XObject, num_strings=1),
+    _make_op(GraphicsState, num_strings=1),
+    _make_op(Rect, kind=_RECT),
+    _make_op(Move, kind=_POINTS),
+    _make_op(Line, kind=_POINTS),
+    _make_op(Bezier, kind=_POINTS),
+    _make_op(BezierV, kind=_POINTS),
+    _make_op(BezierY, kind=_POINTS),
+    _make_op(TextMatrix, kind=_MATRIX),
+    _make_op(CTM, kind=_MATRIX),
+]
+_OPCODES = {op.cls: opcode for opcode, op in enumerate(_OPS)}
+_OPAQUE_OPCODE = len(_OPS)
+_OPS.append(_Op(None, '', _OPAQUE, 0, 1))
+
+
+# Token kinds produced by _ContentStreamTokenizer
+_NUMBER = 'number'
+_NAME = 'name'
+_STRING = 'string'
+_OTHER = 'other'  # any other operand token, e.g. '[', '<<', hex strings
+_OPERATOR = 'operator'
+_DATA = 'data'  # inline image data
+
+_WHITESPACE_CHARS = r'\x00\t\n\x0c\r '
+_REGULAR_CHARS = r'[^\x00\t\n\x0c\r ()<>\[\]{}/%]'
+_TOKEN_RE = re.compile(
+    r'(?P<skip>[{ws}]+|%[^\r\n]*)'
+    r'|(?P<string>\()'
+    r'|(?P<other><<|>>|<[^<>]*>|[\[\]{{}}])'
+    r'|(?P<name>/{regular}*)'
+    r'|(?P<regular>{regular}+)'.format(ws=_WHITESPACE_CHARS, regular=_REGULAR_CHARS)
+)
+_NUMBER_RE = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)$')
+_STRING_SPECIAL_RE = re.compile(r'[()\\]')
+_INLINE_IMAGE_END_RE = re.compile(
+    r'[{ws}]EI(?=[{ws}()<>\[\]{{}}/%]|$)'.format(ws=_WHITESPACE_CHARS)
+)
+_KEYWORDS = frozenset(['true', 'false', 'null'])
+
+# Operand kinds of the commands that have non-numeric operands. All other
+# commands' operands are numbers.
+_OPERAND_KINDS = {
+    Font: (_NAME, _NUMBER),
+    Text: (_STRING,),
+    XObject: (_NAME,),
+    GraphicsState: (_NAME,),
+}
+_COMMAND_CLASSES = {op.cls.COMMAND: op.cls for op in _OPS if op.cls is not None}
+
+
+def parse_content_stream(data):
+    """Parse raw PDF content stream data into command objects, e.g.
+    b'1 0 0 RG 0 0 m 10 10 l S' yields StrokeColor(1, 0, 0), Move(0, 0),
+    Line(10, 10) and Stroke().
+
+    This is a generator, and file objects are read in chunks, so a stream
+    never needs to be fully loaded or parsed into memory at once. Operators
+    that have no command class, or whose operands can't be represented by
+    their command class, are yielded as RawCommands.
+
+    :param bytes|str|file data: content stream data, or a file object to read
+        it from. str data is treated as Latin-1, like pdfrw stream data.
+    :returns generator: of command objects
+    """
+    operands = []
+    tokens = iter(_ContentStreamTokenizer(data))
+    for kind, token in tokens:
+        if kind != _OPERATOR:
+            operands.append((kind, token))
+        elif token == 'BI':
+            yield _read_inline_image(operands, tokens)
+            operands = []
+        else:
+            yield _make_command(token, operands)
+            operands = []
+
+    if operands:
+        raise ValueError('Content stream ends with operands but no operator')
+
+
+def _make_command(command, operands):
+    cls = _COMMAND_CLASSES.get(command)
+    if cls is not None and len(operands) == cls.NUM_ARGS:
+        kinds = _OPERAND_KINDS.get(cls, (_NUMBER,) * cls.NUM_ARGS)
+        if all(kind == expected for (kind, _), expected in zip(operands, kinds)):
+            try:
+                tokens = [_get_operand_value(kind, token) for kind, token in operands]
+                return cls.from_tokens(len(tokens), tokens + [command])
+            except ValueError:
+                pass
+    return RawCommand([token for _, token in operands], command)
+
+
+def _get_operand_value(kind, token):
+    if kind == _NAME:
+        return token[1:]
+    elif kind == _STRING:
+        text = token[1:-1]
+        # Text only escapes backslashes, so strings with any other escape
+        # sequences are kept raw to write them back out unchanged.
+        if '\\' in text.replace('\\\\', ''):
+            raise ValueError('Unsupported escape sequence in {}'.format(token))
+        return text.replace('\\\\', '\\')
+    return token
+
+
+def _read_inline_image(operands, tokens):
+    # Inline images (BI <image dict> ID <data> EI) are kept whole
+    parts = [token for _, token in operands] + ['BI']
+    for kind, token in tokens:
+        if kind == _DATA:
+            parts[-1] = '{} {}'.format(parts[-1], token)
+        elif kind == _OPERATOR and token == 'EI':
+            return RawCommand(parts, token)
+        else:
+            parts.append(token)
+    raise ValueError('Unterminated inline image in content stream')
+
+
+def _iter_chunks(data):
+    if hasattr(data, 'read'):
+        while True:
+            chunk = data.read(PARSE_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    elif isinstance(data, str):
+        yield data
+    else:
+        with memoryview(data) as view:
+            for start in range(0, view.nbytes, PARSE_CHUNK_SIZE):
+                yield view[start:start + PARSE_CHUNK_SIZE]
+
+
+class _ContentStreamTokenizer(object):
+    """Splits content stream data into (kind, token) pairs. Data is decoded
+    as Latin-1 one chunk at a time, and the buffer only holds the unparsed
+    remainder of the chunks read so far.
+    """
+
+    def __init__(self, data):
+        self._chunks = _iter_chunks(data)
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Append the next chunk of data to the buffer, discarding the parsed
+        data before the current position. Returns False at the end of data.
+        """
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            return False
+        if not isinstance(chunk, str):
+            chunk = str(chunk, 'Latin-1')
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _match_token(self):
+        while True:
+            match = _TOKEN_RE.match(self._buffer, self._pos)
+            # A token that reaches the end of the buffer may continue in the
+            # next chunk.
+            if match is not None and (match.end() < len(self._buffer) or self._eof):
+                return match
+            if not self._fill():
+                if match is not None:
+                    return match
+                if self._pos < len(self._buffer):
+                    raise ValueError('Invalid content stream data: {!r}'.format(
+                        self._buffer[self._pos:self._pos + 20]
+                    ))
+                return None
+
+    def __iter__(self):
+        while True:
+            match = self._match_token()
+            if match is None:
+                return
+            kind = match.lastgroup
+            if kind == 'string':
+                yield _STRING, self._read_string()
+                continue
+
+            token = match.group()
+            self._pos = match.end()
+            if kind == 'skip':
+                continue
+            elif kind == 'name':
+                yield _NAME, token
+            elif kind == 'other':
+                yield _OTHER, token
+            elif _NUMBER_RE.match(token):
+                yield _NUMBER, token
+            elif token in _KEYWORDS:
+                yield _OTHER, token
+            else:
+                yield _OPERATOR, token
+                if token == 'ID':
+                    yield _DATA, self._read_inline_image_data()
+
+    def _read_string(self):
+        # Literal strings may contain balanced and escaped parentheses, so
+        # they can't be matched with a regex.
+        i = self._pos + 1
+        depth = 1
+        while True:
+            match = _STRING_SPECIAL_RE.search(self._buffer, i)
+            if match is not None:
+                char = match.group()
+                if char == '\\':
+                    if match.end() < len(self._buffer):
+                        i = match.end() + 1
+                        continue
+                    i = match.start()
+                else:
+                    i = match.end()
+                    depth += 1 if char == '(' else -1
+                    if depth == 0:
+                        string = self._buffer[self._pos:i]
+                        self._pos = i
+                        return string
+                    continue
+            else:
+                i = len(self._buffer)
+
+            offset = i - self._pos
+            if not self._fill():
+                raise ValueError('Unterminated string in content stream')
+            i = offset
+
+    def _read_inline_image_data(self):
+        # ID is followed by a single whitespace character, then the data,
+        # which ends at the first whitespace-delimited EI.
+        start = self._pos + 1
+        while True:
+            match = _INLINE_IMAGE_END_RE.search(self._buffer, start)
+            if match is not None and (match.end() < len(self._buffer) or self._eof):
+                data = self._buffer[start:match.start()]
+                self._pos = match.start() + 1
+                return data
+            offset = start - self._pos
+            if self._fill():
+                start = offset
+            elif match is None:
+                raise ValueError('Unterminated inline image in content stream')
+
+
+def format_number(n, precision=DEFAULT_PRECISION):
+    """Format a number for a PDF content stream. PDFs don't support
+    scientific notation, so numbers are written in fixed-point notation with
+    at most `precision` decimal places, and trailing zeros removed.
+
+    :param number n:
+    :param int|None precision: number of decimal places to round to. If None,
+        the shortest representation that round-trips to the same float is
+        used.
+    :returns str:
+    """
+    if precision is None:
+        return _format_shortest(n)
+    string = '%.*f' % (precision, n)
+    if precision:
+        string = string.rstrip('0').rstrip('.')
+    # Really small negative numbers round to -0
+    return '0' if string == '-0' else string
+
+
+def format_numbers(numbers, precision=DEFAULT_PRECISION):
+    """Format many numbers at once, exactly like format_number. The numbers
+    are formatted with a single string formatting operation, which is much
+    faster than formatting them one by one.
+
+    :param iterable numbers: e.g. a list or array('d')
+    :param int|None precision: see format_number
+    :returns list: list of str
+    """
+    if precision is None:
+        return [_format_shortest(n) for n in numbers]
+    numbers = tuple(numbers)
+    if not numbers:
+        return []
+    fmt = ' '.join(['%.{}f'.format(precision)] * len(numbers))
+    strings = (fmt % numbers).split(' ')
+    if precision:
+        strings = [string.rstrip('0').rstrip('.') for string in strings]
+    if '-0' in strings:
+        strings = ['0' if string == '-0' else string for string in strings]
+    return strings
+
+
+def _format_shortest(n):
     if n % 1 == 0:
         return str(int(n))
-    # Otherwise return 10 decimal places, but remove trailing zeros. I wish I
-    # could use 'g' for this, but that switches to scientific notation at
-    # certain thresholds.
-    string = '{:.10f}'.format(n)
-    i = len(string) - 1
-    while string[i] == '0':
-        i -= 1
-    return string[:i + 1]
+    string = repr(float(n))
+    if 'e' in string:
+        # Expand scientific notation, keeping the same digits
+        string = format(Decimal(string), 'f')
+    return string
 
 
 def quadratic_to_cubic_bezier(
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+    Font Metrics Cache
+    ~~~~~~~~~~~~~~~~~~
+    On-disk cache of the metrics TrueTypeFont calculates from a font file, so
+    that short-lived processes don't parse the whole font on every start.
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from array import array
+from functools import partial
+
+import attr
+
+from pdf_annotate.util.font_metrics import FontMetrics
+
+
+# Bump this when the cached data changes shape. The marshal format and the
+# byte order of the width array are also part of the header, so a cache dir
+# shared between different machines or Pythons is just a cache miss.
+FORMAT_VERSION = 1
+HEADER = b'PDFAFM' + bytes([
+    FORMAT_VERSION,
+    marshal.version,
+    sys.byteorder == 'little',
+])
+# Size of the reads used to hash font files
+CHUNK_SIZE = 1024 * 1024
+
+
+class FontMetricsCache(object):
+    """A directory of cached font metrics, keyed by the SHA-256 hash of the
+    font file's contents. Each entry holds the FontMetrics (including the
+    cmap and widths array) and the advance width table used for measuring
+    text, serialized with marshal.
+    """
+
+    def __init__(self, directory):
+        """
+        :param str directory: cache directory. Created if it doesn't exist.
+        """
+        self.directory = directory
+
+    def get_key(self, font_path):
+        """Get the cache key of a font file: the hash of its contents. Pass
+        it to load and save, so that the file is only hashed once.
+
+        :param str font_path: path to .ttf font file
+        :returns str|None: the key, or None if the file can't be read, in
+            which case there's nothing to cache
+        """
+        digest = hashlib.sha256()
+        try:
+            with open(font_path, 'rb') as f:
+                for data in iter(partial(f.read, CHUNK_SIZE), b''):
+                    digest.update(data)
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    def load(self, key):
+        """Load the cached metrics of a font file.
+
+        :param str key: the font file's key, from get_key
+        :returns tuple|None: (metrics, notdef_width, bmp_widths,
+            other_widths), see TrueTypeFont, or None if the font isn't
+            cached or the cache entry can't be read.
+        """
+        try:
+            with open(self._get_entry_path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(HEADER):
+            return None
+
+        try:
+            fields, notdef_width, bmp_widths, other_widths = marshal.loads(
+                data[len(HEADER):],
+            )
+            widths_table = array('H')
+            widths_table.frombytes(bmp_widths)
+            return (
+                FontMetrics(**fields),
+                notdef_width,
+                widths_table,
+                other_widths,
+            )
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def save(self, key, metrics, notdef_width, bmp_widths, other_widths):
+        """Cache the metrics of a font file. The entry is written to a
+        temporary file first and moved into place, so concurrent readers
+        never see a partial entry. The cache is optional, so if the entry
+        can't be written, e.g. because the directory is read-only, nothing is
+        cached.
+
+        :param str key: the font file's key, from get_key
+        :param FontMetrics metrics:
+        :param int notdef_width: advance width of the .notdef glyph
+        :param array bmp_widths: advance widths of the BMP's code points
+        :param dict other_widths: advance widths of other code points
+        :returns bool: whether the entry was written
+        """
+        data = HEADER + marshal.dumps((
+            attr.asdict(metrics),
+            notdef_width,
+            bmp_widths.tobytes(),
+            other_widths,
+        ))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._get_entry_path(key))
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.directory, key + '.metrics')
@@ -10,6 +10,14 @@
 import math
 
 
+# Below this many points, numpy's per-call overhead outweighs its speedup
+NUMPY_MIN_POINTS = 64
+# The numpy module, or None if it isn't installed. It's only imported the
+# first time it's needed, as importing it takes longer than most documents
+# take to annotate; False until then.
+_numpy = False
+
+
 def normalize_rotation(rotate):
     if rotate % 90:
         raise ValueError('Invalid Rotate value: {}'.format(rotate))
@@ -133,6 +141,50 @@ def transform_point(point, matrix):
     return [new_x, new_y]
 
 
+def transform_points_at(numbers, indices, matrix, vectors=False):
+    """Transform many points stored in a flat buffer, in place.
+
+    Uses numpy if it's installed and there are enough points to make it
+    worthwhile, otherwise a plain loop.
+
+    :param array numbers: array('d') of coordinates
+    :param array indices: array('q') of the positions of each point's x
+        coordinate in numbers; its y coordinate immediately follows.
+    :param list matrix: 6-item list representing transformation matrix
+    :param bool vectors: transform as vectors, i.e. ignore translation
+    """
+    a, b, c, d, e, f = matrix
+    if vectors:
+        e = f = 0
+    numpy = _get_numpy() if len(indices) >= NUMPY_MIN_POINTS else None
+    if numpy is not None:
+        buf = numpy.frombuffer(numbers, dtype=numpy.float64)
+        xi = numpy.frombuffer(indices, dtype=numpy.int64)
+        yi = xi + 1
+        x = buf[xi]
+        y = buf[yi]
+        buf[xi] = x * a + y * c + e
+        buf[yi] = x * b + y * d + f
+        return
+
+    for i in indices:
+        x = numbers[i]
+        y = numbers[i + 1]
+        numbers[i] = x * a + y * c + e
+        numbers[i + 1] = x * b + y * d + f
+
+
+def _get_numpy():
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
 def transform_vector(vector, matrix):
     """Transform a vector by a matrix. This is similar to transform_point,
     except that translation isn't honored. Think of a vector as displacement in
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+    Incremental Writer
+    ~~~~~~~~~~~~~~~~~~
+    Writes PDF incremental updates (see section 7.5.6 - Incremental Updates of
+    the PDF 1.7 Spec): the original bytes of the document are left untouched,
+    and only new and modified objects, plus a new cross-reference section and
+    trailer, are appended to them.
+
+    Only documents with cross-reference tables are supported. pdfrw reads
+    objects from object streams after, and over, those in later sections, so
+    it would read back the original of any object that the update rewrites.
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+import re
+
+from pdfrw import PdfDict
+from pdfrw import PdfName
+from pdfrw.py23_diffs import convert_store
+
+from pdf_annotate.util.pdf_writer import _write
+from pdf_annotate.util.pdf_writer import PdfObjectWriter
+
+
+STARTXREF_RE = re.compile(r'startxref\s+(\d+)')
+XREF_TABLE_RE = re.compile(r'\s*xref\b')
+# Size of the writes used to copy the original document to the output
+CHUNK_SIZE = 1024 * 1024
+
+
+class IncrementalWriter(PdfObjectWriter):
+    """Append-only PDF writer for documents read with pdfrw.PdfReader.
+
+    Objects that were read from the source document carry their (object
+    number, generation) key as their `indirect` attribute. Those objects are
+    written as references, unless they're passed in as modified, in which case
+    they are rewritten under their original key. Objects that are new (i.e.
+    `indirect` is True, or they're stream dicts) get fresh object numbers
+    starting at the source document's /Size.
+    """
+
+    def __init__(self, reader, compress=True):
+        """
+        :param PdfReader reader: the reader the document was loaded with
+        :param bool compress: whether to flate-compress new streams
+        """
+        if reader.Encrypt is not None:
+            raise ValueError(
+                'Incremental updates of encrypted PDFs are not supported'
+            )
+        if uses_xref_streams(reader):
+            raise ValueError(
+                'Incremental updates of PDFs with cross-reference streams or '
+                'object streams are not supported'
+            )
+        super(IncrementalWriter, self).__init__(compress)
+        self._reader = reader
+
+    def write(self, f, modified, source=None):
+        """Write the original document followed by an incremental update.
+
+        :param file f: binary file object to write to
+        :param list modified: objects from the source document that have been
+            modified and must be rewritten
+        :param bytes|memoryview|mmap|None source: the original bytes of the
+            document. If None, they're re-encoded from the data the reader
+            parsed.
+        :returns int: number of bytes written
+        """
+        if source is None:
+            source = convert_store(self._reader.source.fdata)
+        with memoryview(source) as view:
+            size = view.nbytes
+            with view.cast('B') as data:
+                for start in range(0, size, CHUNK_SIZE):
+                    f.write(data[start:start + CHUNK_SIZE])
+        return size + self.write_update(f, modified, size)
+
+    def write_update(self, f, modified, base_offset):
+        """Write only the incremental update section. Use this to append to
+        a file that already holds the original document.
+
+        :param file f: binary file object to write to
+        :param list modified: objects from the source document that have been
+            modified and must be rewritten
+        :param int base_offset: position in the PDF file at which the update
+            section starts
+        :returns int: number of bytes written
+        """
+        self._start(int(self._reader.Size))
+        for obj in modified:
+            key = getattr(obj, 'indirect', False)
+            if not isinstance(key, tuple):
+                raise ValueError(
+                    'Modified object is not an indirect object of the source '
+                    'document: {}'.format(type(obj).__name__)
+                )
+            self._queue.append((key, obj))
+
+        # Leading newline, in case the original doesn't end with an EOL
+        written = _write(f, '\n')
+        offsets = {}
+        written = self._write_objects(f, base_offset, written, offsets)
+
+        startxref = base_offset + written
+        written += _write(f, self._format_xref(offsets))
+        written += _write(f, 'trailer\n{}\nstartxref\n{}\n%%EOF\n'.format(
+            self._format_trailer(),
+            startxref,
+        ))
+        return written
+
+    def _format_trailer(self):
+        reader = self._reader
+        trailer = PdfDict(
+            Size=max(self._next_objnum, int(reader.Size)),
+            Root=reader.Root,
+            Info=reader.Info,
+            ID=reader.ID,
+            Prev=self._get_previous_startxref(),
+        )
+        return self._format_obj(trailer)
+
+    def _get_previous_startxref(self):
+        return _get_startxref(self._reader.source.fdata)
+
+    def _get_source_key(self, obj):
+        key = getattr(obj, 'indirect', False)
+        if isinstance(key, tuple):
+            return key
+        return None
+
+
+def uses_xref_streams(reader):
+    """Whether a document has a cross-reference stream or object streams (see
+    sections 7.5.7 - Object Streams and 7.5.8 - Cross-Reference Streams of the
+    PDF 1.7 Spec), rather than only cross-reference tables.
+
+    :param PdfReader reader: the reader the document was loaded with
+    :returns bool:
+    """
+    # pdfrw loads every object stream when it reads the document
+    if any(
+        getattr(obj, 'Type', None) == PdfName.ObjStm
+        for obj in reader.indirect_objects.values()
+    ):
+        return True
+    # Hybrid-reference files point to their stream from the trailer
+    if reader.XRefStm is not None:
+        return True
+    fdata = reader.source.fdata
+    return XREF_TABLE_RE.match(fdata, _get_startxref(fdata)) is None
+
+
+def _get_startxref(fdata):
+    match = STARTXREF_RE.match(fdata, fdata.rfind('startxref'))
+    if match is None:
+        raise ValueError('Did not find "startxref" in source document')
+    return int(match.group(1))
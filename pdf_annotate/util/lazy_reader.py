@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+    Lazy Reader
+    ~~~~~~~~~~~
+    A pdfrw PdfReader that resolves the page tree on demand.
+
+    pdfrw.PdfReader walks the whole page tree when it's constructed, loading
+    every Pages node and every Page dict in the document. LazyPdfReader instead
+    descends the page tree (see section 7.7.3 - Page Tree of the PDF 1.7 Spec)
+    only when a page is requested, using the /Count of each Pages node to skip
+    over entire subtrees, so only the nodes on the path to that page are loaded.
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+from pdfrw import PdfName
+from pdfrw import PdfReader
+from pdfrw.objects.pdfindirect import PdfIndirect
+
+
+class LazyPdfReader(PdfReader):
+
+    def readpages(self, node):
+        return LazyPages(node)
+
+
+class LazyPages(object):
+    """Read-only sequence of a document's pages, loading each page the first
+    time it's accessed.
+    """
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+        self._pages = {}
+        self._count = None
+
+    @property
+    def _root(self):
+        return self._catalog[PdfName.Pages]
+
+    def __len__(self):
+        if self._count is None:
+            root = self._root
+            self._count = int(root[PdfName.Count]) if root is not None else 0
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('page index out of range')
+
+        page = self._pages.get(index)
+        if page is None:
+            page = self._find_page(self._root, index)
+            self._pages[index] = page
+        return page
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @staticmethod
+    def _find_page(node, index):
+        while True:
+            kids = node[PdfName.Kids]
+            # Count == len(Kids) doesn't mean every kid is a page: an empty
+            # Pages node can make up for a nested one. So the kids before the
+            # page are always checked.
+            for i in range(list.__len__(kids)):
+                kid = _get_kid(kids, i)
+                if kid[PdfName.Type] == PdfName.Pages:
+                    count = int(kid[PdfName.Count])
+                    if index < count:
+                        node = kid
+                        break
+                    index -= count
+                elif index == 0:
+                    return kid
+                else:
+                    index -= 1
+            else:
+                raise IndexError('Invalid page tree')
+
+
+def _get_kid(kids, i):
+    # Index the raw list, so that pdfrw doesn't resolve every sibling
+    kid = list.__getitem__(kids, i)
+    if isinstance(kid, PdfIndirect):
+        kid = kid.real_value()
+        list.__setitem__(kids, i, kid)
+    return kid
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+    PDF Writer
+    ~~~~~~~~~~
+    Writes pdfrw object graphs to PDF files. Unlike pdfrw's PdfWriter, which
+    formats every object, stream data included, as text before writing any of
+    it, objects are written one at a time, and stream data that's bytes (e.g.
+    embedded fonts and images) goes to the file as it is, without ever being
+    decoded to a str.
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+import gc
+import zlib
+from collections import deque
+
+from pdfrw import PdfArray
+from pdfrw import PdfDict
+from pdfrw import PdfName
+from pdfrw.compress import compress as do_compress
+from pdfrw.objects.pdfindirect import PdfIndirect
+from pdfrw.pdfwriter import user_fmt
+from pdfrw.py23_diffs import convert_store
+
+
+# Stream data types that are written as they are. pdfrw's own stream data is
+# Latin-1 str, which is encoded when it's written.
+BINARY_STREAM_TYPES = (bytes, bytearray, memoryview)
+
+
+class PdfObjectWriter(object):
+    """Formats and writes indirect objects. Objects are numbered as they're
+    first referenced, and written in that order.
+    """
+
+    def __init__(self, compress=True):
+        """
+        :param bool compress: whether to flate-compress streams that don't
+            have a filter yet
+        """
+        self._compress = compress
+
+    def _start(self, next_objnum):
+        self._new_keys = {}
+        self._next_objnum = next_objnum
+        self._queue = deque()
+
+    def _get_source_key(self, obj):
+        """The (object number, generation) key under which an object already
+        exists in the output, if it does.
+
+        :returns tuple|None:
+        """
+        return None
+
+    def _write_objects(self, f, base_offset, written, offsets):
+        """Write the queued objects, and the objects they reference.
+
+        :param file f: binary file object to write to
+        :param int base_offset: position in the PDF file at which f starts
+        :param int written: number of bytes already written to f
+        :param dict offsets: (object number, generation) keys to the offsets
+            of the objects written, updated in place
+        :returns int: written, plus the number of bytes written
+        """
+        while self._queue:
+            key, obj = self._queue.popleft()
+            if key in offsets:
+                continue
+            offsets[key] = base_offset + written
+            written += _write(f, '{} {} obj\n{}'.format(
+                key[0],
+                key[1],
+                self._format_obj(obj),
+            ))
+            if isinstance(obj, PdfDict) and obj.stream is not None:
+                written += _write(f, '\nstream\n')
+                written += _write_stream(f, obj.stream)
+                written += _write(f, '\nendstream')
+            written += _write(f, '\nendobj\n')
+        return written
+
+    @staticmethod
+    def _format_xref(offsets):
+        # Group keys into subsections of consecutive object numbers. The free
+        # list head (object 0) is repeated in every section, as most writers do.
+        lines = ['xref', '0 1', '0000000000 65535 f\r']
+        keys = sorted(offsets)
+        start = 0
+        for i in range(1, len(keys) + 1):
+            if i == len(keys) or keys[i][0] != keys[i - 1][0] + 1:
+                lines.append('{} {}'.format(keys[start][0], i - start))
+                for key in keys[start:i]:
+                    lines.append('{:010d} {:05d} n\r'.format(
+                        offsets[key],
+                        key[1],
+                    ))
+                start = i
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, obj):
+        """Return the reference to an indirect object, queueing it for output
+        if it is new, or the formatted object if it is direct.
+        """
+        if isinstance(obj, PdfIndirect):
+            obj = obj.real_value()
+
+        key = self._get_source_key(obj)
+        if key is not None:
+            return '{} {} R'.format(*key)
+
+        indirect = getattr(obj, 'indirect', False)
+        if isinstance(obj, PdfDict):
+            indirect = indirect or obj.stream is not None
+
+        if not indirect:
+            return self._format_obj(obj)
+
+        key = self._new_keys.get(id(obj))
+        if key is None:
+            key = (self._next_objnum, 0)
+            self._next_objnum += 1
+            self._new_keys[id(obj)] = key
+            self._queue.append((key, obj))
+        return '{} {} R'.format(*key)
+
+    def _format_obj(self, obj):
+        """Format an object. Stream dicts are formatted without their stream
+        data, which _write_objects writes after them.
+        """
+        if isinstance(obj, PdfIndirect):
+            obj = obj.real_value()
+
+        if isinstance(obj, PdfDict):
+            if self._compress and obj.stream:
+                _compress_stream(obj)
+            pairs = sorted(
+                (getattr(k, 'encoded', None) or k, v)
+                for k, v in obj.iteritems()
+            )
+            if isinstance(obj.stream, BINARY_STREAM_TYPES):
+                # pdfrw sets Length to the len of the stream, which for
+                # memoryviews counts items rather than bytes.
+                length = _get_stream_length(obj.stream)
+                pairs = [
+                    (k, length if k == '/Length' else v) for k, v in pairs
+                ]
+            return '<<{}>>'.format(' '.join(
+                '{} {}'.format(k, self._add(v)) for k, v in pairs
+            ))
+        elif isinstance(obj, PdfArray):
+            return '[{}]'.format(' '.join(self._add(x) for x in obj))
+        elif isinstance(obj, dict):
+            return self._format_obj(PdfDict(obj))
+        elif isinstance(obj, (list, tuple)):
+            return self._format_obj(PdfArray(obj))
+        elif hasattr(obj, 'indirect'):
+            # pdfrw objects (names, strings, ...) know how to represent
+            # themselves.
+            return str(getattr(obj, 'encoded', None) or obj)
+        return user_fmt(obj)
+
+
+class DocumentWriter(PdfObjectWriter):
+    """Writes a whole document read with pdfrw.PdfReader, renumbering its
+    objects, like pdfrw's PdfWriter does.
+    """
+
+    def __init__(self, reader, version='1.3', compress=True):
+        """
+        :param PdfReader reader: the reader the document was loaded with
+        :param str version: PDF version of the output
+        :param bool compress: whether to flate-compress streams that don't
+            have a filter yet
+        """
+        super(DocumentWriter, self).__init__(compress)
+        self._reader = reader
+        self._version = version
+
+    def write(self, f):
+        """Write the document.
+
+        :param file f: binary file object to write to
+        :returns int: number of bytes written
+        """
+        # Like pdfrw, don't let the garbage collector repeatedly walk the
+        # many objects that are alive while writing.
+        gc.disable()
+        try:
+            return self._write(f)
+        finally:
+            gc.enable()
+
+    def _write(self, f):
+        self._start(1)
+        reader = self._reader
+        trailer = PdfDict(
+            Root=reader.Root,
+            Info=reader.Info,
+            ID=reader.ID,
+            Encrypt=reader.Encrypt,
+        )
+        # Formatting the trailer numbers and queues the objects it references
+        self._format_obj(trailer)
+
+        written = _write(f, '%PDF-{}\n%\xe2\xe3\xcf\xd3\n'.format(self._version))
+        offsets = {}
+        written = self._write_objects(f, 0, written, offsets)
+
+        trailer.Size = self._next_objnum
+        startxref = written
+        written += _write(f, self._format_xref(offsets))
+        written += _write(f, 'trailer\n{}\nstartxref\n{}\n%%EOF\n'.format(
+            self._format_obj(trailer),
+            startxref,
+        ))
+        return written
+
+
+def _compress_stream(obj):
+    if obj.Filter is not None:
+        return
+    if not isinstance(obj.stream, BINARY_STREAM_TYPES):
+        do_compress([obj])
+        return
+    compressed = zlib.compress(obj.stream)
+    # Same threshold as pdfrw
+    if len(compressed) < _get_stream_length(obj.stream) + 30:
+        obj.stream = compressed
+        obj.Filter = PdfName('FlateDecode')
+        obj.DecodeParms = None
+
+
+def _get_stream_length(stream):
+    if isinstance(stream, memoryview):
+        return stream.nbytes
+    return len(stream)
+
+
+def _write_stream(f, stream):
+    if isinstance(stream, BINARY_STREAM_TYPES):
+        f.write(stream)
+        return _get_stream_length(stream)
+    return _write(f, stream)
+
+
+def _write(f, s):
+    data = convert_store(s)
+    f.write(data)
+    return len(data)
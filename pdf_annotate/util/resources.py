@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+    Document Resources
+    ~~~~~~~~~~~~~~~~~~
+    Resource objects shared by all the annotations in a document.
+
+    :copyright: Copyright 2019 Autodesk, Inc.
+    :license: MIT, see LICENSE for details.
+"""
+
+
+class DocumentResources(object):
+    """Registry of the objects that annotations reference from their
+    appearance streams' Resources dicts, e.g. fonts and images. Each object is
+    created the first time it's asked for, as an indirect object, and every
+    annotation after that references the same object. A document with
+    thousands of text annotations thus carries one font object instead of
+    thousands, and a stamp placed hundreds of times is embedded once.
+    """
+
+    def __init__(self):
+        self._fonts = {}
+        self._images = {}
+
+    def get_font(self, key, make_font):
+        """Get the shared font object for key, making it if necessary.
+
+        :param hashable key: identifies the font, e.g. its base font name
+        :param func make_font: function that takes no arguments and returns
+            the font's PdfDict
+        :returns PdfDict: the indirect font object
+        """
+        return self._get(self._fonts, key, make_font)
+
+    def get_image(self, key, make_image):
+        """Get the shared Image XObject for key, making it if necessary.
+
+        :param hashable key: identifies the image and how it's converted,
+            e.g. a hash of the image file and the conversion settings
+        :param func make_image: function that takes no arguments and returns
+            the image's XObject PdfDict
+        :returns PdfDict: the indirect Image XObject
+        """
+        return self._get(self._images, key, make_image)
+
+    def has_image(self, key):
+        """Whether the Image XObject for key has been made.
+
+        :param hashable key: see get_image
+        :returns bool:
+        """
+        return key in self._images
+
+    @staticmethod
+    def _get(objects, key, make_object):
+        obj = objects.get(key)
+        if obj is None:
+            obj = make_object()
+            obj.indirect = True
+            objects[key] = obj
+        return obj
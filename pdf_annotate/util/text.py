@@ -6,6 +6,14 @@
     :copyright: Copyright 2019 Autodesk, Inc.
     :license: MIT, see LICENSE for details.
 """
+import re
+from itertools import accumulate
+
+
+# A token is a run of spaces or of other non-newline characters, followed by
+# its separator: a space or newline after a word, a newline after spaces.
+# See unshift_token.
+TOKEN_RE = re.compile(r'( +|[^ \n]*)([ \n]?)')
 
 
 def unshift_token(text):
@@ -98,13 +106,123 @@ def get_wrapped_lines(text, measure, max_length):
     to maintain consistency in line breaks.
 
     :param str text: text to be broken
-    :param func measure: function that takes a string and returns its width
+    :param func measure: function that takes a string and returns its width.
+        The width of a string must be the sum of its characters' widths.
     :param int max_length: max width of each line
     :returns: list of strings
     """
-    line = unshift_line(text, measure, max_length)
-    lines = [line['text']]
-    while (len(line['remainder']) > 0):
-        line = unshift_line(line['remainder'], measure, max_length)
-        lines.append(line['text'])
-    return lines
+    char_widths = {}
+    widths = []
+    for char in text:
+        width = char_widths.get(char)
+        if width is None:
+            width = char_widths[char] = measure(char)
+        widths.append(width)
+    return [
+        text[start:end]
+        for start, end in get_line_breaks(text, widths, max_length)
+    ]
+
+
+def get_line_breaks(text, widths, max_length, scale=None):
+    """Break a string of text into lines wrapped to max_length, returning the
+    offsets of the lines in text instead of the lines themselves.
+
+    This makes the same breaks as repeatedly calling unshift_line, but each
+    token is measured once, using cumulative sums of the characters' widths,
+    so it takes linear rather than quadratic time in the length of the text.
+
+    :param str text: text to be broken
+    :param list widths: advance width of each character in text
+    :param number max_length: max width of each line
+    :param func|None scale: function that converts a sum of widths to the
+        units of max_length, e.g. TrueTypeFont.scale_width for widths in
+        font units. If None, widths are in the units of max_length.
+    :returns: list of (start, end) tuples, so that text[start:end] is a line
+    """
+    if len(text) == 0:
+        return [(0, 0)]
+
+    # tokens[k] = (start, end, separator end)
+    tokens = [
+        match.span(1) + (match.end(2),)
+        for match in TOKEN_RE.finditer(text)
+        if match.end() > match.start()
+    ]
+    offsets = [0]
+    offsets.extend(accumulate(widths))
+
+    if scale is None:
+        def fits(start, end):
+            return offsets[end] - offsets[start] <= max_length
+    else:
+        def fits(start, end):
+            return scale(offsets[end] - offsets[start]) <= max_length
+
+    breaks = []
+    pos = 0
+    k = 0
+    while pos < len(text):
+        # The first token of a line always goes on it, broken mid-token if it
+        # doesn't fit.
+        token_start, token_end, sep_end = tokens[k]
+        if pos > token_start:
+            # The previous line was broken inside token k. The rest of the
+            # text is tokenized as it would be on its own: the same token,
+            # unless the break was right before the separator.
+            token_start = pos
+            if pos >= token_end:
+                match = TOKEN_RE.match(text, pos)
+                token_end, sep_end = match.end(1), match.end(2)
+        if token_end == token_start:
+            # Empty line
+            breaks.append((pos, pos))
+            pos = sep_end
+            k = _skip_tokens(tokens, k, pos)
+            continue
+
+        end = token_start + 1
+        while end <= token_end and fits(pos, end):
+            end += 1
+        if end <= token_end:
+            # Keep at least one character, so that we always make progress
+            line_end = max(end - 1, pos + 1)
+            breaks.append((pos, line_end))
+            pos = line_end
+            continue
+
+        k = _skip_tokens(tokens, k, sep_end)
+        if text[token_end:sep_end] == '\n':
+            breaks.append((pos, token_end))
+            pos = sep_end
+            continue
+
+        # Add the following tokens while they fit
+        line_end = sep_end
+        while True:
+            if k == len(tokens):
+                breaks.append((pos, line_end))
+                pos = line_end
+                break
+
+            token_start, token_end, sep_end = tokens[k]
+            if not fits(pos, token_end):
+                breaks.append((pos, line_end))
+                pos = line_end
+                break
+
+            k += 1
+            if sep_end == len(text) or text[token_end:sep_end] == '\n':
+                breaks.append((pos, token_end))
+                pos = sep_end
+                break
+            line_end = sep_end
+
+    return breaks
+
+
+def _skip_tokens(tokens, k, pos):
+    """Return the index of the first token starting at or after pos."""
+    while k < len(tokens) and tokens[k][0] < pos:
+        k += 1
+    return k
@@ -6,12 +6,159 @@
     :copyright: Copyright 2019 Autodesk, Inc.
     :license: MIT, see LICENSE for details.
 """
+import threading
+from array import array
+from collections import namedtuple
+from collections import OrderedDict
+from concurrent.futures import Future
+from copy import copy
+
 from fontTools.ttLib import TTFont
 
 from pdf_annotate.util.font_metrics import FontMetrics
+from pdf_annotate.util.font_metrics_cache import FontMetricsCache
+
+
+# Number of parsed fonts get_true_type_font keeps by default
+DEFAULT_FONT_CACHE_SIZE = 16
+# Optional FontMetricsCache shared by fonts loaded with get_true_type_font
+_METRICS_CACHE = None
+# Characters of the Basic Multilingual Plane (U+0000 to U+FFFF) have their
+# advance widths looked up in an array; others in a dict.
+BMP_SIZE = 0x10000
+
+# Statistics of a FontCache, like functools.lru_cache's cache_info()
+FontCacheInfo = namedtuple('FontCacheInfo', [
+    'hits',
+    'misses',
+    'maxsize',
+    'currsize',
+])
+
 
+class FontCache(object):
+    """Least-recently-used cache of parsed fonts, keyed by font file and font
+    name. Font size isn't part of the key: a TrueTypeFont measures text at any
+    size, so all sizes share one parsed font.
 
-_FONT_CACHE = {}
+    The cache is thread-safe. Loading is single-flight: if several threads ask
+    for a font that isn't cached, one of them parses it while the others wait
+    for its result.
+    """
+
+    def __init__(self, maxsize=DEFAULT_FONT_CACHE_SIZE):
+        """
+        :param int|None maxsize: number of fonts to keep, or None for no limit
+        """
+        self.maxsize = maxsize
+        self._fonts = OrderedDict()
+        # Futures of the fonts being loaded, by key
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, path, font_name):
+        """Get a parsed font, loading it if it isn't cached.
+
+        :param str path: path to .ttf font file
+        :param str font_name: name of the font to be included in the PDF file
+        :returns TrueTypeFont:
+        """
+        key = (path, font_name)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._hits += 1
+                self._fonts.move_to_end(key)
+                return font
+
+            self._misses += 1
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = Future()
+                is_loader = True
+            else:
+                is_loader = False
+
+        if not is_loader:
+            # Raises the loading thread's exception if it failed
+            return loading.result()
+
+        try:
+            font = TrueTypeFont(path, font_name, metrics_cache=_METRICS_CACHE)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self._fonts[key] = font
+            self._evict()
+        loading.set_result(font)
+        return font
+
+    def resize(self, maxsize):
+        """Change the number of fonts kept, evicting the least recently used
+        ones if there are now too many.
+
+        :param int|None maxsize: number of fonts to keep, or None for no limit
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def _evict(self):
+        if self.maxsize is None:
+            return
+        while len(self._fonts) > self.maxsize:
+            self._fonts.popitem(last=False)
+
+    def info(self):
+        """:returns FontCacheInfo:"""
+        with self._lock:
+            return FontCacheInfo(
+                hits=self._hits,
+                misses=self._misses,
+                maxsize=self.maxsize,
+                currsize=len(self._fonts),
+            )
+
+    def clear(self):
+        """Drop all fonts and reset the statistics."""
+        with self._lock:
+            self._fonts.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+_FONT_CACHE = FontCache()
+
+
+def set_metrics_cache_dir(directory):
+    """Cache the metrics of fonts loaded by get_true_type_font on disk, in
+    directory, so that later processes load them from there instead of
+    parsing the font files again.
+
+    :param str|None directory: cache directory, or None to stop caching
+    """
+    global _METRICS_CACHE
+    _METRICS_CACHE = FontMetricsCache(directory) if directory else None
+
+
+def set_font_cache_size(maxsize):
+    """Set the number of parsed fonts get_true_type_font keeps in memory.
+
+    :param int|None maxsize: number of fonts to keep, or None for no limit
+    """
+    _FONT_CACHE.resize(maxsize)
+
+
+def get_font_cache_info():
+    """:returns FontCacheInfo: get_true_type_font's cache statistics"""
+    return _FONT_CACHE.info()
 
 
 def get_true_type_font(path, font_name, font_size=None):
@@ -19,16 +166,14 @@ def get_true_type_font(path, font_name, font_size=None):
 
     :param str path: path to .ttf font file
     :param str font_name: name of the font to be included in the PDF file
-    :param int|None font_size:
+    :param int|None font_size: default font size for measuring text. The
+        parsed font is shared by all sizes; this only gets a view of it with
+        a different default.
     :returns TrueTypeFont:
     """
-    key = (path, font_name, font_size)
-    font = _FONT_CACHE.get(key)
-    if font is not None:
-        return font
-
-    font = TrueTypeFont(path, font_name, font_size)
-    _FONT_CACHE[key] = font
+    font = _FONT_CACHE.get(path, font_name)
+    if font_size is not None:
+        font = font.with_font_size(font_size)
     return font
 
 
@@ -38,16 +183,80 @@ class TrueTypeFont:
     needed to embed the font program in a PDF.
     """
 
-    def __init__(self, path, font_name, font_size=None):
+    def __init__(self, path, font_name, font_size=None, metrics_cache=None):
+        """
+        :param str path: path to .ttf font file
+        :param str font_name: name of the font to be included in the PDF file
+        :param int|None font_size: default font size for measuring text
+        :param FontMetricsCache|None metrics_cache: on-disk cache to load the
+            font's metrics from, and to save them to if they aren't cached
+        """
         self.ttfPath = path
-        self._ttfFont = TTFont(self.ttfPath)
+        # fontTools only reads the tables it's asked for, so this is cheap
+        # when the metrics are cached.
+        self._ttfFont = TTFont(self.ttfPath, lazy=True)
+        # Measuring text only reads the tables built below, but reading tables
+        # from the lazily loaded font isn't thread-safe, so calls that do hold
+        # this lock. Copies made by with_font_size share it.
+        self._ttf_lock = threading.Lock()
         # Subsetted fonts have 6 random letters prepended to their names
         # See section 9.6.4 - Font Subsets of the PDF 1.7 Spec
         self.fontName = 'RXMLFT+' + font_name
+        self._font_size = font_size
+
+        cached = None
+        cache_key = None
+        if metrics_cache is not None:
+            cache_key = metrics_cache.get_key(path)
+        if cache_key is not None:
+            cached = metrics_cache.load(cache_key)
+        if cached is not None:
+            (
+                self.metrics,
+                self._notdef_width,
+                self._bmp_widths,
+                self._other_widths,
+            ) = cached
+            return
 
         self.metrics = self._calculate(self._ttfFont)
-        self._glyph_set = self._ttfFont.getGlyphSet()
-        self._font_size = font_size
+        self._make_advance_width_table()
+        if cache_key is not None:
+            metrics_cache.save(
+                cache_key,
+                self.metrics,
+                self._notdef_width,
+                self._bmp_widths,
+                self._other_widths,
+            )
+
+    def _make_advance_width_table(self):
+        """Build the codepoint to advance width table used for measuring.
+        Characters the font does not define get the .notdef character's
+        width.
+        """
+        hmtx = self._ttfFont['hmtx'].metrics
+        self._notdef_width = hmtx['.notdef'][0]
+        # Advance widths are uint16 in the hmtx table
+        self._bmp_widths = array('H', [self._notdef_width]) * BMP_SIZE
+        self._other_widths = {}
+        for codepoint, glyph_name in self.metrics.cmap.items():
+            width = hmtx[glyph_name][0]
+            if codepoint < BMP_SIZE:
+                self._bmp_widths[codepoint] = width
+            else:
+                self._other_widths[codepoint] = width
+
+    def with_font_size(self, font_size):
+        """Get a copy of the font that measures text at font_size by default.
+        The copy shares the parsed font and its metrics with this one.
+
+        :param int font_size:
+        :returns TrueTypeFont:
+        """
+        font = copy(self)
+        font._font_size = font_size
+        return font
 
     def get_glyph_id(self, glyph_name):
         """
@@ -55,7 +264,8 @@ class TrueTypeFont:
         :param glyph_name: The name of the glyph we're retrieving.
         :return: The corresponding glyph ID.
         """
-        return self._ttfFont['glyf'].getGlyphID(glyph_name)
+        with self._ttf_lock:
+            return self._ttfFont['glyf'].getGlyphID(glyph_name)
 
     def measure_text(self, text, font_size=None):
         """Measure a block of text using the font's metrics. If the text
@@ -67,19 +277,51 @@ class TrueTypeFont:
             measurements. If missing, self._font_size is used.
         :returns int: width of text
         """
+        if text and max(text) < chr(BMP_SIZE):
+            width = sum(map(self._bmp_widths.__getitem__, map(ord, text)))
+        else:
+            width = sum(self.get_advance_widths(text))
+        return self.scale_width(width, font_size)
+
+    def measure_many(self, strings, font_size=None):
+        """Measure many blocks of text, e.g. the lines of a paragraph.
+
+        :param iterable strings: the texts to measure
+        :param int|None font_size: see measure_text
+        :returns list: width of each text
+        """
+        return [self.measure_text(text, font_size) for text in strings]
+
+    def get_advance_widths(self, text):
+        """Get the advance width of each character in text, in font units.
+
+        :param str text:
+        :returns list: list of int widths
+        """
+        bmp_widths = self._bmp_widths
+        if text and max(text) < chr(BMP_SIZE):
+            return list(map(bmp_widths.__getitem__, map(ord, text)))
+
+        other_widths = self._other_widths
+        notdef_width = self._notdef_width
+        return [
+            bmp_widths[codepoint] if codepoint < BMP_SIZE
+            else other_widths.get(codepoint, notdef_width)
+            for codepoint in map(ord, text)
+        ]
+
+    def scale_width(self, width, font_size=None):
+        """Scale a width in font units, e.g. a sum of advance widths.
+
+        :param int width: width in font units
+        :param int|None font_size: Font size (in em units) to scale
+            measurements. If missing, self._font_size is used.
+        :returns number: scaled width
+        """
         font_size = font_size if font_size is not None else self._font_size
         if font_size is None:
             raise ValueError('Font size must be specified')
-
-        total_width = 0
-        notdef_width = self._glyph_set['.notdef'].width
-        for character in text:
-            # If the cmap doesn't contain the character, this'll just return
-            # None for the glyph and use .notdef
-            glyph = self._glyph_set.get(self.metrics.cmap.get(ord(character)))
-            total_width += glyph.width if glyph is not None else notdef_width
-        # Scale total width by font size
-        return total_width * font_size / self.metrics.unitsPerEm
+        return width * font_size / self.metrics.unitsPerEm
 
     @staticmethod
     def _calculate(font):
@@ -17,6 +17,8 @@ setup(
         'fonttools>=3.44.0'
     ],
     extras_require={
+        # Speeds up transforming large appearance streams
+        'numpy': ['numpy'],
         'tests': [
             'pre-commit',
             'pytest',
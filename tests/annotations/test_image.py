@@ -1,4 +1,13 @@
 # -*- coding: utf-8 -*-
+import os
+import pickle
+import random
+import shutil
+import struct
+import tempfile
+import zlib
+from io import BytesIO
+from unittest import mock
 from unittest import TestCase
 
 from PIL import Image as PILImage
@@ -11,8 +20,16 @@ from pdf_annotate.config.constants import GRAYSCALE_MODE
 from pdf_annotate.config.location import Location
 from pdf_annotate.util.geometry import identity
 from pdf_annotate.util.geometry import translate
+from pdf_annotate.util.resources import DocumentResources
+from tests.files import ALPHA_PNG
+from tests.files import BINARIZED_PNG
+from tests.files import CMYK_JPEG
+from tests.files import GRAYSCALE_GIF
+from tests.files import GRAYSCALE_JPEG
 from tests.files import GRAYSCALE_PNG
 from tests.files import PNG_FILES
+from tests.files import RGB_JPEG
+from tests.files import RGB_PNG
 
 
 def add_alpha(image):
@@ -28,6 +45,37 @@ def add_alpha(image):
     return new_image
 
 
+def unpredict(data, colors, columns):
+    """Undo PNG predictors (see section 7.4.4.4 of the PDF 1.7 Spec)."""
+    data = zlib.decompress(data)
+    stride = colors * columns
+    rows = []
+    prev = bytearray(stride)
+    for start in range(0, len(data), stride + 1):
+        filter_type = data[start]
+        row = bytearray(data[start + 1:start + 1 + stride])
+        for i in range(stride):
+            a = row[i - colors] if i >= colors else 0
+            b = prev[i]
+            c = prev[i - colors] if i >= colors else 0
+            if filter_type == 1:
+                predicted = a
+            elif filter_type == 2:
+                predicted = b
+            elif filter_type == 3:
+                predicted = (a + b) // 2
+            elif filter_type == 4:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predicted = a if pa <= pb and pa <= pc else b if pb <= pc else c
+            else:
+                predicted = 0
+            row[i] = (row[i] + predicted) & 0xFF
+        rows.append(bytes(row))
+        prev = row
+    return b''.join(rows)
+
+
 class TestImage(TestCase):
 
     def test_as_pdf_object(self):
@@ -73,3 +121,289 @@ class TestImageModes(TestCase):
         assert appropriate_image.mode == GRAYSCALE_MODE
         assert smask.Width == image.size[0]
         assert smask.Height == image.size[1]
+
+    def test_get_raw_image_bytes(self):
+        rgb = PILImage.new('RGB', (2, 2))
+        rgb.putpixel((0, 0), (1, 2, 3))
+        rgb.putpixel((1, 1), (4, 5, 6))
+        assert Image.get_raw_image_bytes(rgb) == bytes([
+            1, 2, 3, 0, 0, 0,
+            0, 0, 0, 4, 5, 6,
+        ])
+
+        gray = rgb.convert(GRAYSCALE_MODE)
+        assert Image.get_raw_image_bytes(gray) == bytes(gray.getdata())
+
+        # Bilevel images get one byte per pixel, not one bit
+        bilevel = PILImage.new('1', (9, 1))
+        bilevel.putpixel((8, 0), 1)
+        assert Image.get_raw_image_bytes(bilevel) == bytes([0] * 8 + [255])
+
+    def test_get_raw_image_bytes_unsupported_mode(self):
+        with self.assertRaises(ValueError):
+            Image.get_raw_image_bytes(PILImage.new('CMYK', (1, 1)))
+
+
+class TestImagePredictor(TestCase):
+
+    def _make_image(self, mode):
+        # Gradients and noise, so that rows pick different filters
+        rng = random.Random(0)
+        image = PILImage.new(mode, (37, 23))
+        bands = len(image.getbands())
+        for x in range(37):
+            for y in range(23):
+                values = [
+                    (x * 7 + y * 3) % 256 if y % 3 else rng.randrange(256)
+                    for _ in range(bands)
+                ]
+                image.putpixel((x, y), tuple(values) if bands > 1 else values[0])
+        return image
+
+    def test_predicted_content_round_trip(self):
+        for mode in ('L', 'RGB', '1'):
+            image = self._make_image(mode)
+            content = Image.make_predicted_image_content(image)
+            parms = Image.make_predictor_decode_parms(image)
+            assert parms.Predictor == 15
+            assert parms.Columns == 37
+            assert unpredict(
+                content,
+                int(parms.Colors),
+                int(parms.Columns),
+            ) == Image.get_raw_image_bytes(image)
+
+    def test_compress_level(self):
+        image = self._make_image('RGB')
+        stored = Image.make_predicted_image_content(image, compress_level=0)
+        compressed = Image.make_predicted_image_content(image, compress_level=9)
+        assert len(compressed) < len(stored)
+
+    def test_image_xobject(self):
+        xobject = Image.make_image_xobject(ALPHA_PNG)
+        assert xobject.Filter == '/FlateDecode'
+        assert xobject.DecodeParms.Colors == 3
+        assert xobject.SMask.DecodeParms.Colors == 1
+
+        xobject = Image.make_image_xobject(ALPHA_PNG, predictor=False)
+        assert xobject.DecodeParms is None
+        assert xobject.SMask.DecodeParms is None
+
+    def test_appearance_settings(self):
+        image = Image(
+            location=Location(x1=0, y1=0, x2=10, y2=10, page=0),
+            appearance=Appearance(image=GRAYSCALE_PNG, image_predictor=False),
+        )
+        assert image.image_xobject.DecodeParms is None
+        with self.assertRaises(ValueError):
+            Appearance(image_compress_level=10)
+
+
+class TestImageStreaming(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _save(self, image, **kwargs):
+        path = os.path.join(self.directory, 'image.png')
+        image.save(path, **kwargs)
+        return path
+
+    def test_can_stream_png(self):
+        assert Image.can_stream_png(PILImage.open(RGB_PNG))
+        assert Image.can_stream_png(PILImage.open(GRAYSCALE_PNG))
+        assert not Image.can_stream_png(PILImage.open(ALPHA_PNG))
+        assert not Image.can_stream_png(PILImage.open(BINARIZED_PNG))
+        assert not Image.can_stream_png(PILImage.open(GRAYSCALE_GIF))
+
+        loaded = PILImage.open(RGB_PNG)
+        loaded.load()
+        assert not Image.can_stream_png(loaded)
+
+        # Pillow doesn't write interlaced PNGs, so set the IHDR's flag
+        with open(RGB_PNG, 'rb') as f:
+            png = bytearray(f.read())
+        png[28] = 1
+        png[29:33] = struct.pack('>I', zlib.crc32(png[12:29]))
+        interlaced = os.path.join(self.directory, 'interlaced.png')
+        with open(interlaced, 'wb') as f:
+            f.write(png)
+        assert not Image.can_stream_png(PILImage.open(interlaced))
+
+    @mock.patch('pdf_annotate.annotations.image.IMAGE_STRIP_SIZE', 1000)
+    def test_streamed_content(self):
+        image = TestImagePredictor()._make_image('RGB')
+        # Several IDAT chunks, each read in several pieces
+        path = self._save(image, compress_level=0, chunk_limit=1500)
+        png = PILImage.open(path)
+        content = Image.make_streamed_png_content(png, compress_level=9)
+        assert unpredict(
+            content,
+            3,
+            image.size[0],
+        ) == Image.get_raw_image_bytes(image)
+        # The image is never decoded
+        assert png.tile
+
+        xobject = Image.make_image_xobject(path, compress_level=9)
+        assert xobject.stream == content
+        assert xobject.DecodeParms.Predictor == 15
+
+    @mock.patch('pdf_annotate.annotations.image.IMAGE_STRIP_SIZE', 100)
+    def test_compressed_content_in_strips(self):
+        for mode in ('L', 'RGB', '1'):
+            image = TestImagePredictor()._make_image(mode)
+            content = Image.make_compressed_image_content(image)
+            assert zlib.decompress(
+                content,
+            ) == Image.get_raw_image_bytes(image)
+
+
+class TestImageJpegPassthrough(TestCase):
+
+    def _read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_passthrough_from_filename(self):
+        for filename in (RGB_JPEG, GRAYSCALE_JPEG):
+            xobject = Image.make_image_xobject(filename)
+            assert xobject.Filter == '/DCTDecode'
+            assert xobject.stream == self._read(filename)
+
+        assert Image.make_image_xobject(GRAYSCALE_JPEG).ColorSpace == '/DeviceGray'
+
+    def test_passthrough_from_image_file(self):
+        data = self._read(RGB_JPEG)
+        for image in (PILImage.open(RGB_JPEG), PILImage.open(BytesIO(data))):
+            xobject = Image.make_image_xobject(image)
+            assert xobject.stream == data
+            assert (xobject.Width, xobject.Height) == image.size
+
+    def test_reencodes_without_passthrough(self):
+        data = self._read(RGB_JPEG)
+        xobject = Image.make_image_xobject(RGB_JPEG, jpeg_passthrough=False)
+        assert xobject.stream != data
+
+        # Loaded from a file object, the original bytes are gone
+        image = PILImage.open(BytesIO(data))
+        image.load()
+        xobject = Image.make_image_xobject(image)
+        content = xobject.stream
+        assert content != data
+        assert content.startswith(b'\xff\xd8')
+
+    def test_changed_image_is_reencoded(self):
+        image = PILImage.open(RGB_JPEG)
+        image.thumbnail((20, 20))
+        xobject = Image.make_image_xobject(image)
+        assert (xobject.Width, xobject.Height) == image.size == (20, 20)
+        encoded = PILImage.open(BytesIO(xobject.stream))
+        assert encoded.size == (20, 20)
+
+    def test_cmyk_is_reencoded(self):
+        xobject = Image.make_image_xobject(CMYK_JPEG)
+        assert xobject.ColorSpace == '/DeviceRGB'
+        assert xobject.stream != self._read(CMYK_JPEG)
+
+
+class TestImageDeduplication(TestCase):
+
+    def test_hash_image(self):
+        assert Image.hash_image(RGB_JPEG) == Image.hash_image(PILImage.open(RGB_JPEG))
+        assert Image.hash_image(RGB_JPEG) != Image.hash_image(GRAYSCALE_JPEG)
+
+        # Loaded images are hashed by their pixels, which may have changed
+        image = PILImage.open(GRAYSCALE_PNG)
+        image.load()
+        digest = Image.hash_image(image)
+        assert digest != Image.hash_image(GRAYSCALE_PNG)
+        image.putpixel((0, 0), 255 - image.getpixel((0, 0)))
+        assert Image.hash_image(image) != digest
+
+    def test_shared_xobject(self):
+        resources = DocumentResources()
+
+        def make_pdf_object(appearance):
+            image = Image(
+                location=Location(x1=0, y1=0, x2=10, y2=10, page=0),
+                appearance=appearance,
+            )
+            obj = image.as_pdf_object(identity(), None, resources)
+            assert obj.Image is obj.AP.N.Resources.XObject.Image
+            return obj
+
+        first = make_pdf_object(Appearance(image=ALPHA_PNG))
+        # A copy of the file is the same image
+        with tempfile.TemporaryDirectory() as directory:
+            copy = shutil.copy(ALPHA_PNG, directory)
+            second = make_pdf_object(Appearance(image=copy))
+        other_settings = make_pdf_object(Appearance(image=ALPHA_PNG, image_predictor=False))
+        other_image = make_pdf_object(Appearance(image=GRAYSCALE_PNG))
+
+        assert first.Image is second.Image
+        assert first.Image.indirect
+        assert other_settings.Image is not first.Image
+        assert other_image.Image is not first.Image
+
+
+class TestImageEncoding(TestCase):
+
+    def test_encoded_image_pickles(self):
+        encoded = Image.encode_image(ALPHA_PNG)
+        assert pickle.loads(pickle.dumps(encoded)) == encoded
+        assert encoded.smask.color_space == 'DeviceGray'
+
+    def test_make_xobject(self):
+        xobj = Image.make_xobject(Image.encode_image(ALPHA_PNG))
+        expected = Image.make_image_xobject(ALPHA_PNG)
+        assert xobj.stream == expected.stream
+        assert xobj.DecodeParms == expected.DecodeParms
+        assert xobj.SMask.stream == expected.SMask.stream
+        assert xobj.SMask.indirect
+
+
+class TestImageDownsampling(TestCase):
+
+    def test_get_max_image_size(self):
+        image = Image(
+            location=Location(x1=0, y1=0, x2=72, y2=144, page=0),
+            appearance=Appearance(image=RGB_JPEG, image_max_dpi=100),
+        )
+        assert image.get_max_image_size(identity()) == (100, 200)
+        # Scaled and rotated 90°: the image's width is now vertical
+        assert image.get_max_image_size([0, 0.5, -0.5, 0, 0, 0]) == (50, 100)
+
+        image = Image(
+            location=Location(x1=0, y1=0, x2=72, y2=144, page=0),
+            appearance=Appearance(image=RGB_JPEG),
+        )
+        assert image.get_max_image_size(identity()) is None
+
+    def test_downsample(self):
+        for filename in (RGB_JPEG, ALPHA_PNG, GRAYSCALE_GIF, BINARIZED_PNG):
+            xobject = Image.make_image_xobject(filename, max_size=(150, 1000))
+            assert (xobject.Width, xobject.Height) == (150, 900)
+            if xobject.SMask is not None:
+                assert (xobject.SMask.Width, xobject.SMask.Height) == (150, 900)
+
+    def test_small_images_are_not_resampled(self):
+        xobject = Image.make_image_xobject(RGB_JPEG, max_size=(1000, 1000))
+        with open(RGB_JPEG, 'rb') as f:
+            assert xobject.stream == f.read()
+
+    def test_image_file_is_not_modified(self):
+        image = PILImage.open(RGB_JPEG)
+        Image.make_image_xobject(image, max_size=(100, 100))
+        assert image.size == (900, 900)
+
+    def test_annotation_downsamples(self):
+        image = Image(
+            location=Location(x1=0, y1=0, x2=72, y2=72, page=0),
+            appearance=Appearance(image=RGB_JPEG, image_max_dpi=150),
+        )
+        obj = image.as_pdf_object([2, 0, 0, 2, 0, 0], page=None)
+        assert (obj.Image.Width, obj.Image.Height) == (300, 300)
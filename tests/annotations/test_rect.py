@@ -25,6 +25,20 @@ class TestSquare(TestCase):
         assert obj.AP.N.BBox == padded_rect
         assert obj.AP.N.Matrix == translate(-(x1 - 1), -(y1 - 1))
 
+    def test_add_additional_resources_override(self):
+        # Subclasses that override the hook with its original signature
+        # keep working.
+        class BlueSquare(Square):
+            def add_additional_resources(self, resources):
+                resources.Color = 'Blue'
+
+        annotation = BlueSquare(
+            Location(x1=10, y1=20, x2=100, y2=200, page=0),
+            Appearance(),
+        )
+        obj = annotation.as_pdf_object(identity(), page=None)
+        assert obj.AP.N.Resources.Color == 'Blue'
+
 
 class TestRoundedRectangle(TestCase):
 
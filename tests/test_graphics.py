@@ -1,8 +1,13 @@
+from array import array
+from io import BytesIO
+from unittest import mock
 from unittest import TestCase
 
+from pdf_annotate import graphics
 from pdf_annotate.graphics import BeginText
 from pdf_annotate.graphics import Bezier
 from pdf_annotate.graphics import Close
+from pdf_annotate.graphics import CompactContentStream
 from pdf_annotate.graphics import ContentStream
 from pdf_annotate.graphics import CTM
 from pdf_annotate.graphics import EndText
@@ -11,9 +16,14 @@ from pdf_annotate.graphics import FillColor
 from pdf_annotate.graphics import FloatTupleCommand
 from pdf_annotate.graphics import Font
 from pdf_annotate.graphics import format_number
+from pdf_annotate.graphics import format_numbers
+from pdf_annotate.graphics import GraphicsState
 from pdf_annotate.graphics import Line
 from pdf_annotate.graphics import MatrixCommand
 from pdf_annotate.graphics import Move
+from pdf_annotate.graphics import parse_content_stream
+from pdf_annotate.graphics import RawCommand
+from pdf_annotate.graphics import ReadOnlyFill
 from pdf_annotate.graphics import Rect
 from pdf_annotate.graphics import Restore
 from pdf_annotate.graphics import Save
@@ -24,6 +34,7 @@ from pdf_annotate.graphics import StrokeWidth
 from pdf_annotate.graphics import Text
 from pdf_annotate.graphics import TextMatrix
 from pdf_annotate.graphics import TupleCommand
+from pdf_annotate.graphics import XObject
 
 
 class TestCommandEquality(TestCase):
@@ -240,6 +251,150 @@ class TestContentStream(TestCase):
         assert transformed == 'q 7 12 m Q'
 
 
+class TestCompactContentStream(TestCase):
+    COMMANDS = [
+        Save(),
+        GraphicsState('GS0'),
+        StrokeWidth(2.5),
+        StrokeColor(0, 0.25, 0),
+        FillColor(1, 0, 0),
+        CTM([1, 0, 0, 1, 3, 4]),
+        Move(10, 10),
+        Line(20.125, 20),
+        Bezier(30, 30, 40, 40, 50, 50),
+        Rect(50, 50, 10, 10),
+        XObject('Image'),
+        Close(),
+        StrokeAndFill(),
+        BeginText(),
+        Font('Helvetica', 12),
+        TextMatrix([1, 0, 0, 1, 20, 50]),
+        Text('back\\slash'),
+        EndText(),
+        Restore(),
+    ]
+
+    def test_resolve_matches_content_stream(self):
+        cs = ContentStream(self.COMMANDS)
+        compact = CompactContentStream(self.COMMANDS)
+        assert compact.resolve() == cs.resolve()
+        assert compact.to_bytes() == cs.resolve().encode('Latin-1')
+        assert compact == cs
+
+    def test_commands_round_trip(self):
+        compact = CompactContentStream(self.COMMANDS)
+        assert len(compact) == len(self.COMMANDS)
+        assert compact.commands == self.COMMANDS
+
+    def test_add_and_extend(self):
+        compact = ContentStream(self.COMMANDS[:5]).compact()
+        compact.add(self.COMMANDS[5])
+        compact.extend(self.COMMANDS[6:])
+        assert compact.commands == self.COMMANDS
+
+    def test_transform_matches_content_stream(self):
+        t = [0, 2, -2, 0, 100, 10]
+        transformed = CompactContentStream(self.COMMANDS).transform(t)
+        assert isinstance(transformed, CompactContentStream)
+        assert transformed.resolve() == ContentStream(self.COMMANDS).transform(t).resolve()
+
+    def test_transform_many_points(self):
+        commands = [Move(0, 0)] + [Line(i, i * 1.5) for i in range(500)] + [Stroke()]
+        t = [0, 2, -2, 0, 100, 10]
+        transformed = CompactContentStream(commands).transform(t)
+        assert transformed.resolve() == ContentStream(commands).transform(t).resolve()
+
+    def test_transform_does_not_modify_original(self):
+        compact = CompactContentStream([Move(1, 1)])
+        compact.transform([2, 0, 0, 2, 5, 10])
+        assert compact.resolve() == '1 1 m'
+
+    def test_commands_without_opcode(self):
+        compact = CompactContentStream([Save(), FakeTupleCommand('a', 'b'), Move(1, 1)])
+        assert compact.resolve() == 'q a b fake 1 1 m'
+        assert compact.transform([1, 0, 0, 1, 1, 1]).resolve() == 'q a b fake 2 2 m'
+        assert compact.commands[1] == FakeTupleCommand('a', 'b')
+
+
+class TestParseContentStream(TestCase):
+    STREAM = (
+        b'q /GS0 gs 2.5 w 0 .25 0 RG 1 0 0 rg 1 0 0 1 3 4 cm 10 10 m '
+        b'20.125 20 l 30 30 40 40 50 50 c 50 50 10 10 re /Image Do h B\n'
+        b'BT /Helvetica 12 Tf 1 0 0 1 20 50 Tm (back\\\\slash) Tj ET Q'
+    )
+
+    def test_parse(self):
+        commands = list(parse_content_stream(self.STREAM))
+        assert commands == TestCompactContentStream.COMMANDS
+
+    def test_parse_str(self):
+        commands = list(parse_content_stream(self.STREAM.decode('Latin-1')))
+        assert commands == TestCompactContentStream.COMMANDS
+
+    def test_parse_file_in_chunks(self):
+        for chunk_size in (1, 2, 3, 7):
+            with mock.patch.object(graphics, 'PARSE_CHUNK_SIZE', chunk_size):
+                commands = list(parse_content_stream(BytesIO(self.STREAM)))
+            assert commands == TestCompactContentStream.COMMANDS
+
+    def test_content_stream_parse(self):
+        cs = ContentStream.parse(self.STREAM)
+        assert cs.commands == TestCompactContentStream.COMMANDS
+        compact = CompactContentStream.parse(self.STREAM)
+        assert isinstance(compact, CompactContentStream)
+        assert compact.commands == TestCompactContentStream.COMMANDS
+
+    def test_comments_and_whitespace(self):
+        commands = list(parse_content_stream(b'%comment\r\n\t1  2\x00m % another\nS'))
+        assert commands == [Move(1, 2), Stroke()]
+
+    def test_read_only_fill(self):
+        commands = list(parse_content_stream(b'F'))
+        assert commands == [ReadOnlyFill()]
+        assert commands[0].resolve() == 'f'
+
+    def test_unknown_operators_are_raw(self):
+        stream = (
+            b'BT 0 -14 Td [(A) -120 (B)] TJ <414243> Tj (a\\)b) Tj ET '
+            b'[3 2] 0 d /OC << /MCID 0 >> BDC EMC 1 2 3 m true null x'
+        )
+        commands = list(parse_content_stream(stream))
+        assert commands[1] == RawCommand(['0', '-14'], 'Td')
+        assert commands[2] == RawCommand(['[', '(A)', '-120', '(B)', ']'], 'TJ')
+        # Strings Text can't write back out unchanged are kept raw
+        assert commands[3] == RawCommand(['<414243>'], 'Tj')
+        assert commands[4] == RawCommand(['(a\\)b)'], 'Tj')
+        # Wrong number of operands
+        assert commands[-1] == RawCommand(['true', 'null'], 'x')
+        assert commands[-2] == RawCommand(['1', '2', '3'], 'm')
+        assert ContentStream(commands).resolve() == (
+            'BT 0 -14 Td [ (A) -120 (B) ] TJ <414243> Tj (a\\)b) Tj ET '
+            '[ 3 2 ] 0 d /OC << /MCID 0 >> BDC EMC 1 2 3 m true null x'
+        )
+
+    def test_raw_commands_are_not_transformed(self):
+        cs = ContentStream.parse(b'0 0 m 1 1 Td')
+        assert cs.transform([1, 0, 0, 1, 5, 5]).resolve() == '5 5 m 1 1 Td'
+
+    def test_nested_strings(self):
+        commands = list(parse_content_stream(b'(a (nested) string) Tj'))
+        assert commands == [Text('a (nested) string')]
+
+    def test_inline_image(self):
+        stream = b'q BI /W 2 /H 1 /BPC 8 /CS /G ID \x00EI\xff EI Q'
+        for chunk_size in (1, 4, 1024):
+            with mock.patch.object(graphics, 'PARSE_CHUNK_SIZE', chunk_size):
+                commands = list(parse_content_stream(BytesIO(stream)))
+            assert commands[0] == Save()
+            assert commands[2] == Restore()
+            assert commands[1].resolve() == 'BI /W 2 /H 1 /BPC 8 /CS /G ID \x00EI\xff EI'
+
+    def test_invalid_streams(self):
+        for stream in (b'1 2', b'(abc', b'BI /W 1 ID abc', b'1 1 m <41'):
+            with self.assertRaises(ValueError):
+                list(parse_content_stream(stream))
+
+
 class TestFormatting(TestCase):
 
     def test_format_number(self):
@@ -252,6 +407,30 @@ class TestFormatting(TestCase):
         assert format_number(1.54) == '1.54'
         assert format_number(0.5) == '0.5'
         assert format_number(3.14159265358979323) == '3.1415926536'
+        assert format_number(2.99999999999) == '3'
+        assert format_number(-0.0) == '0'
+
+    def test_format_number_precision(self):
+        assert format_number(3.14159, precision=2) == '3.14'
+        assert format_number(-0.001, precision=2) == '0'
+        assert format_number(10.4, precision=0) == '10'
+        assert format_number(-0.4, precision=0) == '0'
+        assert format_number(0.1 + 0.2, precision=None) == '0.30000000000000004'
+        assert format_number(1.5e-7, precision=None) == '0.00000015'
+        assert format_number(1e20, precision=None) == '100000000000000000000'
+        assert format_number(-14.0, precision=None) == '-14'
+
+    def test_format_numbers(self):
+        numbers = [
+            0.000000000000000001, -0.000000000000000002, 2, -14, -14.5,
+            15.0, 1.54, 0.5, 3.14159265358979323, 100, 2.99999999999,
+        ]
+        for precision in (None, 0, 2, 10):
+            assert format_numbers(numbers, precision) == [
+                format_number(n, precision) for n in numbers
+            ]
+        assert format_numbers(array('d', [1.25, -0.0])) == ['1.25', '0']
+        assert format_numbers([]) == []
 
     def test_commands_get_number_formatting(self):
         # Regression test to make sure that all commands that output number
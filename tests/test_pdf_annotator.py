@@ -1,4 +1,12 @@
 # -*- coding: utf-8 -*-
+import mmap
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest import mock
 from unittest import TestCase
 
 from pdfrw import PdfReader
@@ -6,7 +14,10 @@ from pdfrw import PdfReader
 from pdf_annotate import Appearance
 from pdf_annotate import Location
 from pdf_annotate import PdfAnnotator
+from pdf_annotate.annotations.base import Annotation
+from pdf_annotate.config.metadata import UNSET
 from pdf_annotate.util.geometry import identity
+from pdf_annotate.util.geometry import matrix_multiply
 from pdf_annotate.util.geometry import translate
 from tests import files
 from tests.utils import assert_matrices_equal
@@ -20,6 +31,33 @@ class TestPdfAnnotator(TestCase):
         a = PdfAnnotator(PdfReader(files.SIMPLE))
         assert a._pdf is not None
 
+    def test_init_lazy(self):
+        a = PdfAnnotator(files.ROTATED_90, lazy=True)
+        assert a.get_rotation(0) == 90
+        a.add_annotation(
+            'square',
+            Location(x1=10, y1=20, x2=20, y2=30, page=0),
+            Appearance(),
+        )
+        with write_to_temp(a) as t:
+            assert len(load_annotations_from_pdf(t)) == 1
+
+    def test_init_with_buffers(self):
+        with open(files.ROTATED_90, 'rb') as f:
+            data = f.read()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for source in (data, memoryview(data), mapped):
+            a = PdfAnnotator(source)
+            assert a.get_rotation(0) == 90
+            a.add_annotation(
+                'square',
+                Location(x1=10, y1=20, x2=20, y2=30, page=0),
+                Appearance(),
+            )
+            with write_to_temp(a) as t:
+                assert len(load_annotations_from_pdf(t)) == 1
+        mapped.close()
+
     def test_write_with_compress_off_smoke_test(self):
         a = PdfAnnotator(PdfReader(files.SIMPLE), compress=False)
         with write_to_temp(a) as t:
@@ -92,6 +130,44 @@ class TestPdfAnnotator(TestCase):
         self.assertEqual(square.Rect, ['4.5', '9.5', '10.5', '15.5'])
 
 
+class ChunkCollector(object):
+    """Minimal non-seekable, write-only stream."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+
+class TestPdfAnnotatorWriteToStream(TestCase):
+
+    def _annotator(self):
+        a = PdfAnnotator(files.ROTATED_90)
+        a.add_annotation(
+            'square',
+            Location(x1=10, y1=20, x2=20, y2=30, page=0),
+            Appearance(),
+        )
+        return a
+
+    def test_write_to_file_object(self):
+        for incremental in (False, True):
+            f = BytesIO()
+            self._annotator().write(f, incremental=incremental)
+            assert not f.closed
+            annotations = PdfReader(fdata=f.getvalue()).pages[0].Annots
+            assert len(annotations) == 1
+
+    def test_write_to_stream_in_chunks(self):
+        for incremental in (False, True):
+            stream = ChunkCollector()
+            self._annotator().write(stream, incremental=incremental)
+            assert len(stream.chunks) > 1
+            data = b''.join(stream.chunks)
+            assert len(PdfReader(fdata=data).pages[0].Annots) == 1
+
+
 class TestPdfAnnotatorGetTransform(TestCase):
 
     def test_identity(self):
@@ -148,3 +224,314 @@ class TestPdfAnnotatorGetTransform(TestCase):
             bounding_box=[0, -30, 20, 0],
             scale=(2, 4),
         )
+
+
+class TestPdfAnnotatorAddAnnotations(TestCase):
+
+    def test_add_annotations(self):
+        a = PdfAnnotator(files.SIMPLE)
+        failures = a.add_annotations([
+            ('square', Location(x1=10, y1=20, x2=20, y2=30, page=0), Appearance()),
+            ('circle', Location(x1=30, y1=20, x2=40, y2=30, page=0), Appearance()),
+        ])
+        assert failures == []
+        with write_to_temp(a) as t:
+            annotations = load_annotations_from_pdf(t)
+
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Circle']
+
+    def test_add_annotations_matches_add_annotation(self):
+        location = Location(x1=10, y1=20, x2=20, y2=30, page=0)
+        single = PdfAnnotator(files.ROTATED_90)
+        single.set_page_dimensions((1584, 1224), 0)
+        single.add_annotation('square', location, Appearance())
+        batch = PdfAnnotator(files.ROTATED_90)
+        batch.set_page_dimensions((1584, 1224), 0)
+        batch.add_annotations([('square', location, Appearance())])
+
+        single_annot = single._pdf.get_page(0).Annots[0]
+        batch_annot = batch._pdf.get_page(0).Annots[0]
+        assert single_annot.Rect == batch_annot.Rect
+        assert single_annot.AP.N.stream == batch_annot.AP.N.stream
+
+    def test_add_annotations_validates_once_per_type(self):
+        a = PdfAnnotator(files.SIMPLE)
+        with mock.patch.object(Annotation, 'validate') as validate:
+            failures = a.add_annotations([
+                ('square', Location(x1=10, y1=20, x2=20, y2=30, page=0), Appearance()),
+                ('square', Location(x1=30, y1=20, x2=40, y2=30, page=0), Appearance()),
+                ('circle', Location(x1=50, y1=20, x2=60, y2=30, page=0), Appearance()),
+            ])
+        assert failures == []
+        assert validate.call_count == 2
+
+    def test_add_annotations_reports_failures(self):
+        a = PdfAnnotator(files.SIMPLE)
+        failures = a.add_annotations([
+            ('square', Location(x1=10, y1=20, x2=20, y2=30, page=0), Appearance()),
+            ('bogus', Location(x1=10, y1=20, x2=20, y2=30, page=0), Appearance()),
+            ('square', Location(x1=10, y1=20, x2=20, y2=30, page=5), Appearance()),
+            ('square', Location(x1=10, y1=20, x2=20, y2=30, page=0), Appearance(), 'bad'),
+            ('circle', Location(x1=10, y1=20, x2=20, y2=30, page=0), Appearance()),
+        ])
+        assert [index for index, _ in failures] == [1, 2, 3]
+        assert all(isinstance(e, ValueError) for _, e in failures)
+        annotations = a._pdf.get_page(0).Annots
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Circle']
+
+
+class TestPdfAnnotatorSharedResources(TestCase):
+
+    def test_text_annotations_share_font(self):
+        a = PdfAnnotator(files.SIMPLE)
+        appearance = Appearance(content='Hi', fill=(0, 0, 0))
+        a.add_annotation(
+            'text',
+            Location(x1=10, y1=20, x2=100, y2=30, page=0),
+            appearance,
+        )
+        a.add_annotations([
+            ('text', Location(x1=10, y1=40, x2=100, y2=50, page=0), appearance),
+            ('square', Location(x1=10, y1=40, x2=100, y2=50, page=0), Appearance()),
+            ('text', Location(x1=10, y1=60, x2=100, y2=70, page=0), appearance),
+        ])
+        fonts = [
+            annot.AP.N.Resources.Font.values()[0]
+            for annot in a._pdf.get_page(0).Annots
+            if annot.Subtype == '/FreeText'
+        ]
+        assert len(fonts) == 3
+        assert all(font is fonts[0] for font in fonts)
+
+        # The font is written once, as an indirect object they all reference
+        with write_to_temp(a) as t:
+            annotations = load_annotations_from_pdf(t)
+        fonts = [
+            annot.AP.N.Resources.Font.values()[0]
+            for annot in annotations
+            if annot.Subtype == '/FreeText'
+        ]
+        assert fonts[0].BaseFont == '/Helvetica'
+        assert all(font is fonts[0] for font in fonts)
+
+
+class TestPdfAnnotatorParallelImages(TestCase):
+
+    def _add_images(self, executor=None):
+        # Without metadata, which has timestamps and random names, the output
+        # is deterministic
+        a = PdfAnnotator(files.SIMPLE)
+        failures = a.add_annotations(
+            [
+                ('image', Location(x1=10, y1=20, x2=50, y2=60, page=0), Appearance(image=image), UNSET)
+                for image in [files.RGB_PNG, files.RGB_JPEG, files.ALPHA_PNG, files.RGB_PNG]
+            ] + [
+                ('image', Location(x1=10, y1=20, x2=50, y2=60, page=0), Appearance(image='missing.png'), UNSET),
+            ],
+            executor=executor,
+        )
+        output = BytesIO()
+        a.write(output)
+        return failures, output.getvalue()
+
+    def _assert_matches_serial(self, executor):
+        failures, output = self._add_images()
+        parallel_failures, parallel_output = self._add_images(executor)
+        assert [index for index, _ in parallel_failures] == [4]
+        assert type(parallel_failures[0][1]) is type(failures[0][1])
+        assert parallel_output == output
+
+    def test_thread_pool(self):
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            self._assert_matches_serial(executor)
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self._assert_matches_serial(executor)
+
+    def test_images_are_encoded_once(self):
+        a = PdfAnnotator(files.SIMPLE)
+        executor = ThreadPoolExecutor(max_workers=2)
+        with mock.patch.object(executor, 'submit', wraps=executor.submit) as submit:
+            a.add_annotations(
+                [
+                    ('image', Location(x1=10, y1=20, x2=50, y2=60, page=0), Appearance(image=files.RGB_JPEG)),
+                    ('image', Location(x1=60, y1=20, x2=100, y2=60, page=0), Appearance(image=files.RGB_JPEG)),
+                ],
+                executor=executor,
+            )
+            assert submit.call_count == 1
+            # Already in the document's resources, so there's nothing to do
+            a.add_annotations(
+                [('image', Location(x1=10, y1=20, x2=50, y2=60, page=0), Appearance(image=files.RGB_JPEG))],
+                executor=executor,
+            )
+            assert submit.call_count == 1
+        executor.shutdown()
+
+        xobjects = [annot.Image for annot in a._pdf.get_page(0).Annots]
+        assert all(xobject is xobjects[0] for xobject in xobjects)
+
+
+class TestPdfAnnotatorPageGeometry(TestCase):
+
+    def test_geometry_is_cached(self):
+        a = PdfAnnotator(files.ROTATED_90)
+        geometry = a._get_page_geometry(0)
+        assert a._get_page_geometry(0) is geometry
+        assert geometry.rotation == 90
+        assert geometry.bounding_box == a.get_page_bounding_box(0)
+        assert_matrices_equal(
+            geometry.transform,
+            PdfAnnotator._get_transform(geometry.bounding_box, 90, (1, 1)),
+        )
+
+    def test_set_page_dimensions_invalidates_geometry(self):
+        a = PdfAnnotator(files.SIMPLE)
+        assert a.get_scale(0) == (1, 1)
+        a.set_page_dimensions((1275, 3300), 0)
+        assert a.get_scale(0) == (0.48, 0.24)
+        assert_matrices_equal(a.get_transform(0, 0), [0.48, 0, 0, 0.24, 0, 0])
+
+    def test_clear_page_geometry(self):
+        a = PdfAnnotator(files.SIMPLE)
+        assert a.get_size(0) == (612.0, 792.0)
+        a._pdf.get_page(0).CropBox = [0, 0, 100, 200]
+        a.clear_page_geometry(0)
+        assert a.get_size(0) == (100.0, 200.0)
+
+    def test_inverse_transform(self):
+        a = PdfAnnotator(files.ROTATED_90)
+        a.set_page_dimensions((1584, 1224), 0)
+        assert_matrices_equal(
+            matrix_multiply(a.get_transform(0, 90), a.get_inverse_transform(0)),
+            identity(),
+        )
+
+
+class TestPdfAnnotatorIncrementalWrite(TestCase):
+
+    def setUp(self):
+        self.output = tempfile.mktemp(suffix='.pdf')
+
+    def tearDown(self):
+        if os.path.exists(self.output):
+            os.remove(self.output)
+
+    def _annotate(self, a):
+        a.add_annotations([
+            ('square', Location(x1=10, y1=20, x2=20, y2=30, page=0), Appearance()),
+            (
+                'image',
+                Location(x1=30, y1=20, x2=40, y2=30, page=0),
+                Appearance(image=files.ALPHA_PNG),
+            ),
+        ])
+
+    def test_incremental_write_appends_to_original(self):
+        a = PdfAnnotator(files.ROTATED_90)
+        self._annotate(a)
+        a.write(self.output, incremental=True)
+
+        with open(files.ROTATED_90, 'rb') as f:
+            original = f.read()
+        with open(self.output, 'rb') as f:
+            written = f.read()
+        assert written.startswith(original.rstrip(b'\r\n\x00'))
+        # Only the page, plus the annotations, their appearance streams and
+        # the image and smask XObjects, are written
+        assert written.count(b' obj\n', len(original)) == 7
+
+        annotations = load_annotations_from_pdf(self.output)
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Square']
+        assert annotations[1].AP.N.Resources.XObject.Image.SMask is not None
+
+    def test_incremental_write_from_buffer(self):
+        with open(files.ROTATED_90, 'rb') as f:
+            original = f.read()
+        a = PdfAnnotator(memoryview(original))
+        self._annotate(a)
+        a.write(self.output, incremental=True)
+
+        with open(self.output, 'rb') as f:
+            assert f.read().startswith(original)
+        assert len(load_annotations_from_pdf(self.output)) == 2
+
+    def test_incremental_overwrite(self):
+        shutil.copy(files.ROTATED_90, self.output)
+        a = PdfAnnotator(self.output)
+        self._annotate(a)
+        a.write(overwrite=True, incremental=True)
+
+        annotations = load_annotations_from_pdf(self.output)
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Square']
+
+    def test_incremental_write_to_source_path(self):
+        shutil.copy(files.ROTATED_90, self.output)
+        with open(self.output, 'rb') as f:
+            original = f.read()
+        a = PdfAnnotator(self.output)
+        self._annotate(a)
+        a.write(self.output, incremental=True)
+
+        with open(self.output, 'rb') as f:
+            assert f.read().startswith(original)
+        annotations = load_annotations_from_pdf(self.output)
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Square']
+
+    def test_incremental_write_with_object_streams(self):
+        # simple.pdf keeps its objects in object streams, so it's written in
+        # full rather than as an update pdfrw would read the old page from.
+        a = PdfAnnotator(files.SIMPLE)
+        self._annotate(a)
+        with self.assertWarns(UserWarning):
+            a.write(self.output, incremental=True)
+
+        annotations = load_annotations_from_pdf(self.output)
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Square']
+
+        # Annotations added later don't replace the earlier ones
+        a = PdfAnnotator(self.output)
+        a.add_annotation(
+            'circle',
+            Location(x1=10, y1=20, x2=20, y2=30, page=0),
+            Appearance(),
+        )
+        with write_to_temp(a) as t:
+            annotations = load_annotations_from_pdf(t)
+        assert [annot.Subtype for annot in annotations] == [
+            '/Square',
+            '/Square',
+            '/Circle',
+        ]
+
+    def test_incremental_overwrite_with_object_streams(self):
+        shutil.copy(files.SIMPLE, self.output)
+        a = PdfAnnotator(self.output)
+        self._annotate(a)
+        with self.assertWarns(UserWarning):
+            a.write(overwrite=True, incremental=True)
+
+        annotations = load_annotations_from_pdf(self.output)
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Square']
+
+    def test_write_to_source_path(self):
+        shutil.copy(files.ROTATED_90, self.output)
+        a = PdfAnnotator(self.output)
+        self._annotate(a)
+        a.write(self.output)
+
+        annotations = load_annotations_from_pdf(self.output)
+        assert [annot.Subtype for annot in annotations] == ['/Square', '/Square']
+
+    def test_overwrite(self):
+        shutil.copy(files.ROTATED_90, self.output)
+        a = PdfAnnotator(self.output)
+        self._annotate(a)
+        a.write(overwrite=True)
+        assert len(load_annotations_from_pdf(self.output)) == 2
+
+    def test_overwrite_requires_filename(self):
+        a = PdfAnnotator(PdfReader(files.ROTATED_90))
+        with self.assertRaises(ValueError):
+            a.write(overwrite=True)
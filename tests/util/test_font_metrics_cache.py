@@ -0,0 +1,79 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+from unittest import TestCase
+
+from pdf_annotate.annotations.text import HELVETICA_PATH
+from pdf_annotate.config.constants import DEFAULT_BASE_FONT
+from pdf_annotate.util.font_metrics_cache import FontMetricsCache
+from pdf_annotate.util.true_type_font import TrueTypeFont
+
+
+class TestFontMetricsCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FontMetricsCache(os.path.join(self.directory, 'fonts'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _load_font(self):
+        return TrueTypeFont(HELVETICA_PATH, DEFAULT_BASE_FONT, 12, self.cache)
+
+    def test_miss(self):
+        assert self.cache.load(self.cache.get_key(HELVETICA_PATH)) is None
+
+    def test_round_trip(self):
+        uncached = TrueTypeFont(HELVETICA_PATH, DEFAULT_BASE_FONT, 12)
+        self._load_font()
+        assert len(os.listdir(self.cache.directory)) == 1
+
+        with mock.patch.object(TrueTypeFont, '_calculate') as mock_calculate:
+            font = self._load_font()
+        assert not mock_calculate.called
+
+        assert font.metrics == uncached.metrics
+        text = 'Hi there, Ꮤ\U0001F600'
+        assert font.get_advance_widths(text) == uncached.get_advance_widths(text)
+        assert font.measure_text(text) == uncached.measure_text(text)
+
+    def test_unreadable_entry_is_a_miss(self):
+        self._load_font()
+        entry = os.path.join(
+            self.cache.directory,
+            os.listdir(self.cache.directory)[0],
+        )
+        with open(entry, 'r+b') as f:
+            f.truncate(20)
+        assert self.cache.load(self.cache.get_key(HELVETICA_PATH)) is None
+
+        # Loading the font again replaces the bad entry
+        self._load_font()
+        assert self.cache.load(self.cache.get_key(HELVETICA_PATH)) is not None
+
+    def test_missing_font_file(self):
+        assert self.cache.get_key(os.path.join(self.directory, 'no.ttf')) is None
+
+    def test_unwritable_directory(self):
+        # A file where the cache directory should be can't be made into one
+        blocker = os.path.join(self.directory, 'blocker')
+        open(blocker, 'w').close()
+        cache = FontMetricsCache(os.path.join(blocker, 'fonts'))
+        uncached = TrueTypeFont(HELVETICA_PATH, DEFAULT_BASE_FONT, 12)
+
+        font = TrueTypeFont(HELVETICA_PATH, DEFAULT_BASE_FONT, 12, cache)
+        assert font.metrics == uncached.metrics
+        assert cache.load(cache.get_key(HELVETICA_PATH)) is None
+
+    def test_hashes_font_once(self):
+        with mock.patch(
+            'pdf_annotate.util.font_metrics_cache.hashlib.sha256',
+            wraps=hashlib.sha256,
+        ) as sha256:
+            # A miss, which saves the metrics, then a hit
+            self._load_font()
+            self._load_font()
+        assert sha256.call_count == 2
@@ -1,10 +1,18 @@
+import subprocess
+import sys
+from array import array
+from unittest import mock
 from unittest import TestCase
 
+from pdf_annotate.util import geometry
 from pdf_annotate.util.geometry import identity
 from pdf_annotate.util.geometry import matrix_multiply
 from pdf_annotate.util.geometry import matrix_inverse
 from pdf_annotate.util.geometry import rotate
 from pdf_annotate.util.geometry import scale
+from pdf_annotate.util.geometry import transform_point
+from pdf_annotate.util.geometry import transform_points_at
+from pdf_annotate.util.geometry import transform_vector
 from pdf_annotate.util.geometry import translate
 
 
@@ -75,3 +83,53 @@ class TestMatrixMath(TestCase):
         ident = identity()
 
         assert ident == matrix_inverse(ident)
+
+
+class TestTransformPointsAt(TestCase):
+    MATRIX = [0, 2, -3, 0, 7, 11]
+
+    def _check(self, num_points):
+        # Interleave untouched values between points
+        numbers = array('d')
+        indices = array('q')
+        for i in range(num_points):
+            numbers.append(-1)
+            indices.append(len(numbers))
+            numbers.extend([i, i * 0.5])
+
+        expected_points = array('d', numbers)
+        expected_vectors = array('d', numbers)
+        for i in indices:
+            expected_points[i:i + 2] = array('d', transform_point(numbers[i:i + 2], self.MATRIX))
+            expected_vectors[i:i + 2] = array('d', transform_vector(numbers[i:i + 2], self.MATRIX))
+
+        points = array('d', numbers)
+        transform_points_at(points, indices, self.MATRIX)
+        assert points == expected_points
+
+        vectors = array('d', numbers)
+        transform_points_at(vectors, indices, self.MATRIX, vectors=True)
+        assert vectors == expected_vectors
+
+    def test_few_points(self):
+        self._check(3)
+
+    def test_many_points(self):
+        self._check(geometry.NUMPY_MIN_POINTS * 2)
+
+    def test_many_points_without_numpy(self):
+        with mock.patch.object(geometry, '_numpy', None):
+            self._check(geometry.NUMPY_MIN_POINTS * 2)
+
+    def test_numpy_is_imported_on_first_use(self):
+        with mock.patch.object(geometry, '_numpy', False):
+            self._check(3)
+            assert geometry._numpy is False
+            self._check(geometry.NUMPY_MIN_POINTS * 2)
+            assert geometry._numpy is not False
+
+        subprocess.check_call([
+            sys.executable,
+            '-c',
+            'import sys, pdf_annotate; assert "numpy" not in sys.modules',
+        ])
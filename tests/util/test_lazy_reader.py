@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from unittest import TestCase
+
+from pdfrw import IndirectPdfDict
+from pdfrw import PdfName
+from pdfrw import PdfReader
+from pdfrw import PdfWriter
+from pdfrw.objects.pdfindirect import PdfIndirect
+
+from pdf_annotate.util.lazy_reader import LazyPdfReader
+from tests import files
+
+
+def make_pages_node(kids):
+    node = IndirectPdfDict(
+        Type=PdfName('Pages'),
+        Kids=kids,
+        Count=sum(kid.Count if kid.Type == PdfName('Pages') else 1 for kid in kids),
+    )
+    for kid in kids:
+        kid.Parent = node
+    return node
+
+
+def make_page(width):
+    return IndirectPdfDict(Type=PdfName('Page'), MediaBox=[0, 0, width, 100])
+
+
+def count_loaded(reader):
+    return sum(
+        1 for obj in reader.indirect_objects.values()
+        if not isinstance(obj, PdfIndirect)
+    )
+
+
+class TestLazyPdfReader(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # A nested page tree, with pages numbered by MediaBox width:
+        # [[0, 1, 2], 3, [[4, 5]]]
+        root = make_pages_node([
+            make_pages_node([make_page(0), make_page(1), make_page(2)]),
+            make_page(3),
+            make_pages_node([make_pages_node([make_page(4), make_page(5)])]),
+        ])
+        trailer = IndirectPdfDict(
+            Root=IndirectPdfDict(Type=PdfName('Catalog'), Pages=root),
+        )
+        cls.filename = tempfile.mktemp(suffix='.pdf')
+        PdfWriter().write(cls.filename, trailer=trailer)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.filename)
+
+    def test_page_count(self):
+        assert len(LazyPdfReader(self.filename).pages) == 6
+
+    def test_get_pages(self):
+        reader = LazyPdfReader(self.filename)
+        widths = [int(page.MediaBox[2]) for page in reader.pages]
+        assert widths == [0, 1, 2, 3, 4, 5]
+        assert reader.pages[-1] is reader.pages[5]
+        with self.assertRaises(IndexError):
+            reader.pages[6]
+
+    def test_loads_only_path_to_page(self):
+        reader = LazyPdfReader(self.filename)
+        eager = PdfReader(self.filename)
+        loaded = count_loaded(reader)
+        reader.pages[3]
+        # Only the first subtree's root (to read its Count) and the page
+        # itself are loaded.
+        assert count_loaded(reader) - loaded == 2
+        assert count_loaded(reader) < count_loaded(eager)
+
+    def test_empty_pages_node(self):
+        # As many kids as pages, but not every kid is a page:
+        # [[], 0, [1, 2]]
+        root = make_pages_node([
+            make_pages_node([]),
+            make_page(0),
+            make_pages_node([make_page(1), make_page(2)]),
+        ])
+        trailer = IndirectPdfDict(
+            Root=IndirectPdfDict(Type=PdfName('Catalog'), Pages=root),
+        )
+        filename = tempfile.mktemp(suffix='.pdf')
+        PdfWriter().write(filename, trailer=trailer)
+        try:
+            reader = LazyPdfReader(filename)
+            assert len(reader.pages) == 3
+            assert int(reader.pages[1].MediaBox[2]) == 1
+            widths = [int(page.MediaBox[2]) for page in reader.pages]
+            assert widths == [0, 1, 2]
+        finally:
+            os.remove(filename)
+
+    def test_matches_eager_reader(self):
+        reader = LazyPdfReader(files.SIMPLE)
+        eager = PdfReader(files.SIMPLE)
+        assert len(reader.pages) == len(eager.pages)
+        assert reader.pages[0].MediaBox == eager.pages[0].MediaBox
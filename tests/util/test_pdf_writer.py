@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import zlib
+from array import array
+from io import BytesIO
+from unittest import TestCase
+
+from pdfrw import IndirectPdfDict
+from pdfrw import PdfName
+from pdfrw import PdfReader
+from pdfrw.py23_diffs import convert_store
+
+from pdf_annotate.util.incremental_writer import IncrementalWriter
+from pdf_annotate.util.incremental_writer import uses_xref_streams
+from pdf_annotate.util.pdf_writer import DocumentWriter
+from tests import files
+
+
+# Every byte value, so that any text round trip would show
+DATA = bytes(range(256)) * 4
+
+
+def read_stream(pdf, obj_name):
+    reader = PdfReader(fdata=pdf.decode('Latin-1'))
+    stream = reader.pages[0][obj_name]
+    data = convert_store(stream.stream)
+    if stream.Filter == '/FlateDecode':
+        data = zlib.decompress(data)
+    return data
+
+
+class TestDocumentWriter(TestCase):
+
+    def _write(self, stream, compress=False, **kwargs):
+        reader = PdfReader(files.SIMPLE)
+        reader.pages[0].Binary = IndirectPdfDict(stream=stream, **kwargs)
+        output = BytesIO()
+        written = DocumentWriter(reader, '1.6', compress=compress).write(output)
+        assert written == len(output.getvalue())
+        return output.getvalue()
+
+    def test_writes_bytes_as_they_are(self):
+        for stream in (DATA, bytearray(DATA), memoryview(DATA)):
+            pdf = self._write(stream)
+            assert pdf.startswith(b'%PDF-1.6\n')
+            assert b'\nstream\n' + DATA + b'\nendstream' in pdf
+            assert read_stream(pdf, '/Binary') == DATA
+
+    def test_memoryview_length(self):
+        widths = array('H', range(100))
+        pdf = self._write(memoryview(widths))
+        assert read_stream(pdf, '/Binary') == widths.tobytes()
+
+    def test_compress(self):
+        pdf = self._write(DATA, compress=True)
+        assert DATA not in pdf
+        assert read_stream(pdf, '/Binary') == DATA
+
+        # Streams that already have a filter are left alone
+        jpeg = b'\xff\xd8' + DATA
+        pdf = self._write(jpeg, compress=True, Filter=PdfName('DCTDecode'))
+        assert jpeg in pdf
+
+    def test_text_streams(self):
+        pdf = self._write(DATA.decode('Latin-1'))
+        assert read_stream(pdf, '/Binary') == DATA
+
+
+class TestIncrementalWriterBinaryStreams(TestCase):
+
+    def test_writes_bytes_as_they_are(self):
+        with open(files.ROTATED_90, 'rb') as f:
+            original = f.read()
+        reader = PdfReader(fdata=original.decode('Latin-1'))
+        page = reader.pages[0]
+        page.Binary = IndirectPdfDict(stream=DATA)
+        output = BytesIO()
+        IncrementalWriter(reader, compress=False).write(output, [page], original)
+
+        pdf = output.getvalue()
+        assert b'\nstream\n' + DATA + b'\nendstream' in pdf
+        assert read_stream(pdf, '/Binary') == DATA
+
+    def test_xref_streams_are_not_supported(self):
+        reader = PdfReader(files.SIMPLE)
+        assert uses_xref_streams(reader)
+        with self.assertRaises(ValueError):
+            IncrementalWriter(reader)
+
+        assert not uses_xref_streams(PdfReader(files.ROTATED_90))
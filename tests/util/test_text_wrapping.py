@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
+import random
 from unittest import TestCase
 
+from pdf_annotate.annotations.text import HELVETICA_PATH
+from pdf_annotate.config.constants import DEFAULT_BASE_FONT
+from pdf_annotate.util.text import get_line_breaks
 from pdf_annotate.util.text import get_wrapped_lines
 from pdf_annotate.util.text import unshift_line
 from pdf_annotate.util.text import unshift_token
+from pdf_annotate.util.true_type_font import get_true_type_font
 
 
 class TestUnshiftToken(TestCase):
@@ -140,3 +145,70 @@ class TestGetWrappedLines(TestCase):
     def test_single_line(self):
         lines = get_wrapped_lines('Hi', lambda text: len(text), 10)
         assert lines == ['Hi']
+
+    def test_empty_text(self):
+        assert get_wrapped_lines('', lambda text: len(text), 10) == ['']
+
+
+def unshift_lines(text, measure, max_length):
+    """Line breaking by repeatedly calling unshift_line."""
+    line = unshift_line(text, measure, max_length)
+    lines = [line['text']]
+    while len(line['remainder']) > 0:
+        line = unshift_line(line['remainder'], measure, max_length)
+        lines.append(line['text'])
+    return lines
+
+
+class TestGetLineBreaks(TestCase):
+
+    def test_offsets(self):
+        text = "Hi, I'm a big block of text!"
+        breaks = get_line_breaks(text, [1] * len(text), 10)
+        assert breaks == [(0, 10), (10, 20), (20, 28)]
+
+    def test_newlines_are_skipped(self):
+        breaks = get_line_breaks('ab\n\ncd', [1] * 6, 10)
+        assert breaks == [(0, 2), (3, 3), (4, 6)]
+
+    def test_scale(self):
+        text = 'abc def'
+        assert get_line_breaks(text, [10] * 7, 4, scale=lambda w: w / 10) == [
+            (0, 4),
+            (4, 7),
+        ]
+
+    def test_same_breaks_as_unshift_line(self):
+        widths = {'a': 1, 'b': 2, 'W': 5, 'i': 0.5, ' ': 1, '\t': 2, '\n': 0}
+
+        def measure(text):
+            return sum(widths[char] for char in text)
+
+        rng = random.Random(0)
+        for _ in range(2000):
+            text = ''.join(
+                rng.choice('aab   \n\nWi\t')
+                for _ in range(rng.randint(0, 60))
+            )
+            max_length = rng.choice([0, 1, 2, 3, 5, 8, 15])
+            for m in (len, measure):
+                assert get_wrapped_lines(text, m, max_length) == (
+                    unshift_lines(text, m, max_length)
+                ), (text, max_length)
+
+    def test_same_breaks_as_unshift_line_with_font(self):
+        font = get_true_type_font(HELVETICA_PATH, DEFAULT_BASE_FONT, 12)
+        text = (
+            'Lorem ipsum dolor sit amet,  consectetur adipiscing elit.\n\n'
+            'Supercalifragilisticexpialidocious  words   are\tbroken. '
+        ) * 5
+        for max_length in (0, 5, 30, 100, 250):
+            breaks = get_line_breaks(
+                text,
+                font.get_advance_widths(text),
+                max_length,
+                scale=font.scale_width,
+            )
+            assert [text[start:end] for start, end in breaks] == (
+                unshift_lines(text, font.measure_text, max_length)
+            )
@@ -1,8 +1,10 @@
+import threading
 from unittest import mock
 from unittest import TestCase
 
 from pdf_annotate.annotations.text import HELVETICA_PATH
 from pdf_annotate.config.constants import DEFAULT_BASE_FONT
+from pdf_annotate.util.true_type_font import FontCache
 from pdf_annotate.util.true_type_font import get_true_type_font
 from pdf_annotate.util.true_type_font import TrueTypeFont
 
@@ -43,6 +45,30 @@ class TestTrueTypeFont(TestCase):
             )
         )
 
+    def test_advance_widths(self):
+        text = 'Hi, Ꮤ'
+        widths = self.font.get_advance_widths(text)
+        assert len(widths) == len(text)
+        assert all(isinstance(width, int) for width in widths)
+        assert widths[-1] == self.font.get_advance_widths('﷽')[0]
+        assert self.font.scale_width(sum(widths)) == self.font.measure_text(text)
+        assert self.font.scale_width(sum(widths), 20) == self.font.measure_text(text, 20)
+
+    def test_measure_astral_chars(self):
+        # Characters outside the BMP: this one isn't in the font (U+1F600)
+        assert self.font.measure_text('a\U0001F600') == (
+            self.font.measure_text('a') + self.font.measure_text('Ꮤ')
+        )
+
+    def test_measure_many(self):
+        texts = ['abc', '', 'Hi there', '\U0001F600']
+        assert self.font.measure_many(texts) == [
+            self.font.measure_text(text) for text in texts
+        ]
+        assert self.font.measure_many(texts, 20) == [
+            self.font.measure_text(text, 20) for text in texts
+        ]
+
     def test_missing_font_size(self):
         font = TrueTypeFont(HELVETICA_PATH, DEFAULT_BASE_FONT)
         with self.assertRaises(ValueError):
@@ -52,11 +78,84 @@ class TestTrueTypeFont(TestCase):
         get_true_type_font(HELVETICA_PATH, DEFAULT_BASE_FONT)
         with mock.patch('pdf_annotate.util.true_type_font.TrueTypeFont') as mock_get:
             get_true_type_font(HELVETICA_PATH, DEFAULT_BASE_FONT)
+            # All font sizes share the parsed font
+            font = get_true_type_font(HELVETICA_PATH, DEFAULT_BASE_FONT, 16)
 
         assert not mock_get.called
+        assert font.measure_text('abc') == self.font.measure_text('abc', 16)
+        assert font.metrics is get_true_type_font(HELVETICA_PATH, DEFAULT_BASE_FONT).metrics
 
-        # Using different params means you skip the cache
+        # Using a different font name means you skip the cache
         with mock.patch('pdf_annotate.util.true_type_font.TrueTypeFont') as mock_get:
-            get_true_type_font(HELVETICA_PATH, DEFAULT_BASE_FONT, 16)
+            get_true_type_font(HELVETICA_PATH, 'Other')
 
         assert mock_get.called
+
+
+class TestFontCache(TestCase):
+
+    def test_lru_eviction_and_stats(self):
+        cache = FontCache(maxsize=2)
+        with mock.patch('pdf_annotate.util.true_type_font.TrueTypeFont') as mock_font:
+            cache.get(HELVETICA_PATH, 'A')
+            cache.get(HELVETICA_PATH, 'B')
+            cache.get(HELVETICA_PATH, 'A')
+            # Evicts B, the least recently used
+            cache.get(HELVETICA_PATH, 'C')
+            cache.get(HELVETICA_PATH, 'A')
+            cache.get(HELVETICA_PATH, 'B')
+
+        assert mock_font.call_count == 4
+        info = cache.info()
+        assert (info.hits, info.misses, info.maxsize, info.currsize) == (2, 4, 2, 2)
+
+        cache.resize(1)
+        assert cache.info().currsize == 1
+        cache.clear()
+        assert cache.info() == (0, 0, 1, 0)
+
+    def test_unbounded(self):
+        cache = FontCache(maxsize=None)
+        with mock.patch('pdf_annotate.util.true_type_font.TrueTypeFont'):
+            for i in range(50):
+                cache.get(HELVETICA_PATH, str(i))
+        assert cache.info().currsize == 50
+
+    def test_single_flight_loading(self):
+        cache = FontCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def load_font(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return mock.sentinel.font
+
+        results = []
+        with mock.patch(
+            'pdf_annotate.util.true_type_font.TrueTypeFont',
+            side_effect=load_font,
+        ) as mock_font:
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(cache.get(HELVETICA_PATH, 'A')),
+                )
+                for _ in range(8)
+            ]
+            threads[0].start()
+            started.wait(5)
+            for thread in threads[1:]:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        assert mock_font.call_count == 1
+        assert results == [mock.sentinel.font] * 8
+
+    def test_failed_load_is_not_cached(self):
+        cache = FontCache()
+        with self.assertRaises(IOError):
+            cache.get('/does/not/exist.ttf', 'A')
+        assert cache.info().currsize == 0
+        assert cache._loading == {}